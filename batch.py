@@ -0,0 +1,221 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from file_utils import file_sha256, spooled_output
+from result_cache import cache_key, default_cache
+from table_output import XLSX
+
+SENNEBOGEN = "sennebogen"
+LIEBHERR = "liebherr"
+QBO = "qbo"
+# sennebogen.AUTO, repeated here so pages can offer it without importing the extractor
+SENNEBOGEN_AUTO = "auto"
+
+# Conversions offered for batch files: label -> (extractor, Sennebogen detector option)
+CONVERSIONS = {
+    "Sennebogen (auto-detect)": (SENNEBOGEN, SENNEBOGEN_AUTO),
+    "Sennebogen option 1": (SENNEBOGEN, 1),
+    "Sennebogen option 2": (SENNEBOGEN, 2),
+    "Sennebogen option 3": (SENNEBOGEN, 3),
+    "Liebherr": (LIEBHERR, None),
+    "QBO receiving report": (QBO, None),
+}
+DEFAULT_CONVERSION = "Sennebogen (auto-detect)"
+
+QUEUED = "queued"
+CACHED = "cached"
+DONE = "done"
+FAILED = "failed"
+
+REPORT_FILE = "batch_report.csv"
+
+
+def guess_conversion(file_name):
+    """Picks the conversion for a file from its name; anything unrecognized is treated as a Sennebogen manual."""
+    name = file_name.lower()
+    if "liebherr" in name:
+        return "Liebherr"
+    if "qbo" in name or "purchase" in name:
+        return "QBO receiving report"
+    return DEFAULT_CONVERSION
+
+
+def conversion_settings(extractor, option, output_format):
+    """(code version, cache settings, output extension) of a conversion, matching the single-file page."""
+    # the extractors are imported here so a worker only loads the ones it runs
+    if extractor == SENNEBOGEN:
+        import sennebogen
+        budget = [sennebogen.PAGE_TIMEOUT, sennebogen.MAX_PAGE_OBJECTS]
+        return sennebogen.EXTRACTOR_VERSION, [option, output_format] + budget, output_format
+    if extractor == LIEBHERR:
+        import liebherr
+        budget = [liebherr.PAGE_TIMEOUT, liebherr.MAX_PAGE_OBJECTS]
+        return liebherr.EXTRACTOR_VERSION, [output_format] + budget, output_format
+    if extractor == QBO:
+        import qbo
+        return qbo.REPORT_VERSION, [], "pdf"
+    raise ValueError(f"Unknown extractor {extractor!r}")
+
+
+def convert_file(
+    pdf_path, extractor, option, output_format, output_path=None, workers=1, checkpoint_dir=None, profiler=None,
+    review=None
+):
+    """
+    Converts one PDF into output_path; the unit of work for the batch pool.
+
+    Batch files run without checkpoints, since a failed file is simply run
+    again, and with a single page worker each, so the pool size bounds the
+    CPU the batch uses. workers and checkpoint_dir are passed on to the
+    Sennebogen extractor for single long conversions. Without output_path
+    the extractor's result (a file object, or the report bytes for QBO) is
+    returned instead. Pages the parts extractors had to skip are appended to
+    review (see sennebogen.extract_tables_).
+    """
+    # the extractor is imported on first use, so pages that only offer it load quickly
+    if extractor == SENNEBOGEN:
+        import sennebogen
+        result = sennebogen.extract_tables_(
+            pdf_path, option, workers, output_format=output_format, output_path=output_path,
+            checkpoint_dir=checkpoint_dir, profiler=profiler, review=review
+        )
+    elif extractor == LIEBHERR:
+        import liebherr
+        result = liebherr.extract_tables_(
+            pdf_path, output_format, output_path, checkpoint_dir=checkpoint_dir, profiler=profiler, review=review
+        )
+    elif extractor == QBO:
+        import qbo
+        result = qbo.pdf_creation(pdf_path, profiler)
+        if output_path is None:
+            return result
+        with open(output_path, "wb") as f:
+            f.write(result)
+    else:
+        raise ValueError(f"Unknown extractor {extractor!r}")
+    return output_path if output_path is not None else result
+
+
+def _convert_reviewed(*args):
+    """convert_file for the batch pool: (output path, pages needing review)."""
+    review = []
+    return convert_file(*args, review=review), review
+
+
+def _output_name(file_name, extension, taken):
+    """Name of a file's output inside the ZIP, made unique when two uploads share a name."""
+    stem = os.path.splitext(os.path.basename(file_name))[0] or "output"
+    name = f"{stem}.{extension}"
+    n = 2
+    while name in taken:
+        name = f"{stem} ({n}).{extension}"
+        n += 1
+    taken.add(name)
+    return name
+
+
+def run_batch(files, output_format=XLSX, workers=2, progress=None, cache=None):
+    """
+    Converts many PDFs on a bounded process pool and packs the outputs into one ZIP.
+
+    Files whose result is already in the conversion cache are not converted
+    again; the others are scheduled onto at most workers processes, and
+    their results are added to the cache, unless pages of theirs had to be
+    skipped (a rerun may get them).
+
+    Args:
+        files: list of (file name, path or file-like PDF, conversion label
+            from CONVERSIONS)
+        output_format: "xlsx", "csv" or "parquet" for the parts manuals;
+            QBO files always become a PDF receiving report
+        workers: number of files converted at the same time
+        progress: optional callable(index into files, status, message)
+            called from this thread when a file is queued, found in the
+            cache, finishes or fails
+        cache: ResultCache to use; defaults to result_cache.default_cache()
+
+    Returns:
+        (ZIP file object positioned at the start, list of per-file result
+        dicts with name, conversion, status, output and message). The ZIP
+        holds every output plus batch_report.csv.
+    """
+    cache = cache or default_cache()
+    progress = progress or (lambda i, status, message="": None)
+    results = []
+    archive = spooled_output()
+    taken = {REPORT_FILE}
+    work_dir = tempfile.mkdtemp(prefix="batch-")
+    try:
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            pending = []
+            for i, (name, pdf, conversion) in enumerate(files):
+                extractor, option = CONVERSIONS[conversion]
+                version, settings, extension = conversion_settings(extractor, option, output_format)
+                result = {
+                    "name": name,
+                    "conversion": conversion,
+                    "status": QUEUED,
+                    "output": _output_name(name, extension, taken),
+                    "message": "",
+                }
+                results.append(result)
+                key = cache_key(file_sha256(pdf), extractor, version, settings)
+                data = cache.get(key)
+                if data is not None:
+                    zf.writestr(result["output"], data)
+                    result["status"] = CACHED
+                    progress(i, CACHED)
+                    continue
+                # workers open the PDF themselves, so uploads are written to disk first
+                pdf_path = os.path.join(work_dir, f"{i}.pdf")
+                if isinstance(pdf, (str, os.PathLike)):
+                    shutil.copyfile(pdf, pdf_path)
+                else:
+                    pdf.seek(0)
+                    with open(pdf_path, "wb") as f:
+                        shutil.copyfileobj(pdf, f)
+                output_path = os.path.join(work_dir, f"{i}.{extension}")
+                pending.append((i, result, key, (pdf_path, extractor, option, output_format, output_path)))
+                progress(i, QUEUED)
+
+            if pending:
+                # spawn keeps workers independent of the threads Streamlit runs us in
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending))), mp_context=context) as pool:
+                    futures = {}
+                    for i, result, key, args in pending:
+                        futures[pool.submit(_convert_reviewed, *args)] = (i, result, key)
+                    for future in as_completed(futures):
+                        i, result, key = futures[future]
+                        try:
+                            output_path, review = future.result()
+                        except Exception as e:
+                            result["status"] = FAILED
+                            result["message"] = str(e)
+                            progress(i, FAILED, str(e))
+                            continue
+                        zf.write(output_path, result["output"])
+                        if review:
+                            result["message"] = f"{len(review)} page(s) need review"
+                        else:
+                            try:
+                                with open(output_path, "rb") as f:
+                                    cache.put(key, f.read())
+                            except OSError as e:
+                                print(f"⚠️ Could not store conversion result in cache: {e}")
+                        os.remove(output_path)
+                        result["status"] = DONE
+                        progress(i, DONE, result["message"])
+
+            report = pd.DataFrame(results, columns=["name", "conversion", "status", "output", "message"])
+            zf.writestr(REPORT_FILE, report.to_csv(index=False))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    archive.seek(0)
+    return archive, results
@@ -0,0 +1 @@
+"""Throughput benchmarks for the PDF extractors on synthetic manuals."""
@@ -0,0 +1,130 @@
+"""
+Import-time benchmark for the Streamlit pages.
+
+Streamlit re-runs a page script on every interaction, and the first run of
+each page in a fresh server imports everything the page imports at the top.
+This benchmark finds those top-level imports (by parsing each page, without
+running it) and times importing them in a fresh interpreter with
+python -X importtime, reporting the total per page and the heaviest
+packages behind it. Modules that cannot be imported here, because they or
+one of their dependencies are not installed, are listed; the time counted
+is then only what was imported up to the missing package.
+
+Run from the repository root:
+
+    python -m benchmarks.import_time --budget 1.5
+
+With --budget the exit status is 1 when a page takes longer than that many
+seconds to import, so the check can guard against a heavy import creeping
+back in.
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["home.py"] + sorted(glob.glob("pages/*.py", root_dir=REPO_ROOT))
+# Modules pages import lazily on first use, timed for reference
+LAZY_MODULES = ["sennebogen", "liebherr", "qbo", "senn_web"]
+REPEAT = 3
+
+
+def top_level_imports(path):
+    """Top-level modules imported at module level by a script (imports inside functions are lazy)."""
+    with open(os.path.join(REPO_ROOT, path), "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            if name not in modules:
+                modules.append(name)
+    return modules
+
+
+def import_seconds(modules):
+    """
+    Seconds a fresh interpreter spends importing modules, the cumulative
+    seconds of each top-level package it loaded (from -X importtime), and
+    the modules that failed to import as {module: missing package}.
+    """
+    code = "".join(
+        f"try:\n    import {module}\nexcept ModuleNotFoundError as e:\n    print({module!r}, e.name)\n"
+        for module in modules
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    packages = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # nested imports are indented under the module that triggered them
+        if name.startswith("  "):
+            continue
+        packages[name.strip()] = int(cumulative) / 1e6
+    missing = dict(line.split() for line in completed.stdout.splitlines())
+    return sum(packages.values()), packages, missing
+
+
+def measure(name, modules, repeat=REPEAT):
+    """Best of repeat runs, so a cold disk cache on the first run does not count."""
+    runs = [import_seconds(modules) for _ in range(repeat)]
+    seconds, packages, missing = min(runs, key=lambda run: run[0])
+    return {
+        "name": name,
+        "modules": modules,
+        "missing": missing,
+        "seconds": seconds,
+        "heaviest": sorted(packages.items(), key=lambda item: item[1], reverse=True)[:5],
+    }
+
+
+def format_report(results):
+    lines = [f"{'imports of':<45} {'seconds':>8}  heaviest packages"]
+    for r in results:
+        heaviest = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in r["heaviest"] if seconds >= 0.01)
+        lines.append(f"{r['name']:<45} {r['seconds']:>8.2f}  {heaviest}")
+        if r["missing"]:
+            lines.append("    not importable here: " + ", ".join(
+                f"{module} (needs {package})" for module, package in r["missing"].items()
+            ))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", nargs="+", default=PAGES, help="page scripts, relative to the repository root")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--budget", type=float, help="fail when a page's imports take longer than this many seconds")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = [measure(page, top_level_imports(page), args.repeat) for page in args.pages]
+    lazy = [measure(f"{module} (lazy)", [module], args.repeat) for module in LAZY_MODULES]
+    print(format_report(results + lazy))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results + lazy, f, indent=2)
+
+    if args.budget is not None:
+        slow = [r for r in results if r["seconds"] > args.budget]
+        for r in slow:
+            print(f"{r['name']} imports in {r['seconds']:.2f}s, over the {args.budget:.2f}s budget", file=sys.stderr)
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Scaling benchmark for the parts extractors.
+
+Generates synthetic manuals (see benchmarks.synthetic_pdf) and runs each
+extractor on them in a fresh child process, reporting wall time, pages/sec,
+CPU time and peak RSS. With --stages the extractors' StageProfiler hooks are
+switched on and the time spent in each extraction stage is listed as well,
+along with the slowest pages.
+
+Run from the repository root:
+
+    python -m benchmarks.run --sizes 10 100 --kinds sennebogen1 liebherr
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_pdf import KINDS, LIEBHERR, SENNEBOGEN_KINDS, build_manual
+
+SIZES = (10, 100, 1000, 5000)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def manual_path(kind, pages, seed=0, drawing_every=None):
+    """Path of the synthetic manual, generating it on first use."""
+    suffix = f"-d{drawing_every}" if drawing_every else ""
+    path = os.path.join(DATA_DIR, f"{kind}-{pages}-s{seed}{suffix}.pdf")
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        print(f"Generating {os.path.basename(path)}...", file=sys.stderr)
+        build_manual(path + ".tmp", kind, pages, seed, drawing_every)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def run_extractor(kind, pdf_path, output_format, workers, stages=False):
+    """
+    Runs one extraction in this process and returns its measurements.
+
+    Template and checkpoint stores are kept in a temporary directory so every
+    run starts cold and leaves nothing behind.
+    """
+    import sennebogen
+    import liebherr
+    from profiling import StageProfiler, peak_rss_mb
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, f"out.{output_format}")
+        if kind == LIEBHERR:
+            def extract():
+                liebherr.extract_tables_(pdf_path, output_format, output_path, checkpoint_dir=None, profiler=profiler)
+        else:
+            def extract():
+                sennebogen.extract_tables_(
+                    pdf_path, SENNEBOGEN_KINDS[kind], workers,
+                    template_cache=os.path.join(tmp, "templates.json"),
+                    output_format=output_format, output_path=output_path, checkpoint_dir=None,
+                    profiler=profiler
+                )
+
+        profiler = StageProfiler() if stages else None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        extract()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        output_bytes = os.path.getsize(output_path)
+
+    return {
+        "seconds": wall,
+        "cpu_seconds": cpu,
+        "peak_rss_mb": peak_rss_mb(),
+        "output_bytes": output_bytes,
+        "stages": {total["stage"]: total["wall"] for total in profiler.stage_totals()} if profiler else {},
+        "slow_pages": profiler.slow_pages(5) if profiler else [],
+    }
+
+
+def measure(kind, pages, output_format="xlsx", workers=1, stages=False, drawing_every=None):
+    """Runs one benchmark case in a child process, so peak RSS belongs to that case alone."""
+    pdf_path = manual_path(kind, pages, drawing_every=drawing_every)
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = os.path.join(tmp, "result.json")
+        command = [
+            sys.executable, "-m", "benchmarks.run", "--child", result_path,
+            "--kinds", kind, "--format", output_format, "--workers", str(workers), pdf_path,
+        ]
+        if stages:
+            command.append("--stages")
+        subprocess.run(command, cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(result_path, "r") as f:
+            result = json.load(f)
+    result.update({"kind": kind, "pages": pages, "format": output_format, "workers": workers})
+    result["pages_per_second"] = pages / result["seconds"] if result["seconds"] else None
+    return result
+
+
+def format_report(results):
+    lines = [f"{'kind':<12} {'pages':>6} {'seconds':>9} {'pages/s':>8} {'cpu s':>8} {'peak MB':>8}"]
+    for r in results:
+        peak = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "n/a"
+        lines.append(
+            f"{r['kind']:<12} {r['pages']:>6} {r['seconds']:>9.2f} {r['pages_per_second']:>8.1f} "
+            f"{r['cpu_seconds']:>8.2f} {peak:>8}"
+        )
+        if r["stages"]:
+            lines.append("    " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in r["stages"].items()))
+        if r.get("slow_pages"):
+            lines.append("    slowest pages: " + ", ".join(
+                f"{page['page']} ({page['wall']:.2f}s)" for page in r["slow_pages"]
+            ))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--format", choices=("xlsx", "csv", "parquet"), default="xlsx")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--stages", action="store_true", help="report time per extraction stage and the slowest pages")
+    parser.add_argument("--drawing-every", type=int, default=None,
+                        help="mix an index page and a drawing every n pages into Sennebogen manuals")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("pdf", nargs="?", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_extractor(args.kinds[0], args.pdf, args.format, args.workers, args.stages)
+        with open(args.child, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = []
+    for kind in args.kinds:
+        for pages in args.sizes:
+            result = measure(kind, pages, args.format, args.workers, args.stages, args.drawing_every)
+            print(f"{kind} x {pages} pages: {result['seconds']:.1f}s", file=sys.stderr)
+            results.append(result)
+    print(format_report(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Synthetic parts manuals for benchmarking, drawn with borb.
+
+The pages imitate the layouts the extractors handle: the three Sennebogen
+header styles (left-justified bold headers, headers in rectangles, headers
+between vertical rules) and the Liebherr half-page table. Content is random
+but seeded, so a given kind, page count and seed always produce the same PDF.
+"""
+import random
+
+from borb.pdf import Document, Page, Chunk, Shape, PDF
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+
+SENNEBOGEN_HEADERS = [
+    ("Fig./", "Pos."), ("No./", "Ident."), ("Nomenclature", ""), ("Benennung", ""),
+    ("Qty./", "Menge."), ("Qty. Unit/", ""), ("MPOS~Remark/", "Bemerkung"), ("see page", "s. Seite"),
+]
+SENNEBOGEN_X = [40, 80, 140, 260, 380, 420, 460, 520, 560]
+LIEBHERR_X = [40, 70, 150, 200, 300, 340, 420, 490, 555]
+
+SENNEBOGEN_KINDS = {"sennebogen1": 1, "sennebogen2": 2, "sennebogen3": 3}
+LIEBHERR = "liebherr"
+KINDS = tuple(SENNEBOGEN_KINDS) + (LIEBHERR,)
+
+
+def _text(page, s, x, top, size=7, bold=False):
+    """Places s with its top edge at top (pdfplumber coordinates, measured from the top of the page)."""
+    font = "Helvetica-Bold" if bold else "Helvetica"
+    Chunk(s, font=font, font_size=size).paint((x, PAGE_HEIGHT - top - size - 2, 200, size + 2), page)
+
+
+def _hline(page, x0, x1, top):
+    y = PAGE_HEIGHT - top
+    Shape([(x0, y), (x1, y)], line_width=1).paint((x0, y - 1, x1 - x0, 1), page)
+
+
+def _vline(page, x, top, bottom):
+    Shape([(x, PAGE_HEIGHT - top), (x, PAGE_HEIGHT - bottom)], line_width=1).paint(
+        (x - 1, PAGE_HEIGHT - bottom - 1, 1, bottom - top), page
+    )
+
+
+def _rect(page, x0, top, x1, bottom):
+    points = [
+        (x0, PAGE_HEIGHT - top), (x1, PAGE_HEIGHT - top), (x1, PAGE_HEIGHT - bottom),
+        (x0, PAGE_HEIGHT - bottom), (x0, PAGE_HEIGHT - top),
+    ]
+    Shape(points, line_width=1).paint((x0, PAGE_HEIGHT - bottom - 1, x1 - x0, bottom - top), page)
+
+
+def sennebogen_page(layout, rng, n_rows=25):
+    """
+    One Sennebogen parts page in header layout 1, 2 or 3. Every seventh row
+    is an overflow line continuing the part above it.
+    """
+    page = Page()
+    _text(page, "SENNEBOGEN Ersatzteilliste", 40, 30, size=9)
+    top = 120
+    for i, (first, second) in enumerate(SENNEBOGEN_HEADERS):
+        x = SENNEBOGEN_X[i] + 2
+        if layout == 2:
+            _rect(page, SENNEBOGEN_X[i], top, SENNEBOGEN_X[i + 1], top + 24)
+            x = (SENNEBOGEN_X[i] + SENNEBOGEN_X[i + 1]) / 2 - 12
+        _text(page, first, x, top + 2, bold=True)
+        if second:
+            _text(page, second, x, top + 11, bold=True)
+    if layout == 3:
+        for x in SENNEBOGEN_X:
+            _vline(page, x, top, top + 24 + n_rows * 16)
+
+    y = top + 24
+    if layout == 2:
+        _rect(page, 40, top, 560, top + 0.5)
+        _rect(page, 40, y, 560, y + 0.5)
+    else:
+        _hline(page, 40, 560, top)
+        _hline(page, 40, 560, y)
+    position = 1
+    for row in range(n_rows):
+        overflow = row % 7 == 3
+        if overflow:
+            cells = ["", "", "continued text", "", "", "", "", ""]
+        else:
+            cells = [
+                str(position), str(rng.randint(100000, 999999)), f"Part {rng.randint(1, 999)}", "Teil",
+                str(rng.randint(1, 9)), "PCS", "", "",
+            ]
+            position += 1
+        for x, cell in zip(SENNEBOGEN_X, cells):
+            if cell:
+                _text(page, cell, x + 2, y + 4)
+        y += 16
+        if layout == 2:
+            _rect(page, 40, y, 560, y + 0.5)
+        else:
+            _hline(page, 40, 560, y)
+    return page
+
+
+def liebherr_page(rng, n_rows=20):
+    """One Liebherr parts page: assembly header and parts table in the bottom half."""
+    page = Page()
+    top = PAGE_HEIGHT / 2 + 10
+    for x in LIEBHERR_X:
+        _vline(page, x, top, PAGE_HEIGHT - 30)
+    _text(page, "Asm.", 42, top + 4)
+    _text(page, f"Order: {rng.randint(100, 999)} {rng.randint(100, 999)}", 342, top + 4)
+    _text(page, "Liebherr", 42, top + 14)
+    _text(page, "Serial range", 500, top + 14)
+    _text(page, "Pos", 42, top + 24, bold=True)
+    _text(page, "Order no.", 72, top + 24, bold=True)
+    y = top + 34
+    for row in range(n_rows):
+        if row % 5 == 0:
+            designation = f"Bolt -> (Group no. {rng.randint(10, 99)} {rng.randint(100, 999)})"
+        else:
+            designation = "Washer"
+        cells = [
+            str(row + 1), f"{rng.randint(1000, 9999)} {rng.randint(100, 999)}", f"{rng.randint(1, 9)},000",
+            designation, "", "", "A1", "ZZ99999",
+        ]
+        for x, cell in zip(LIEBHERR_X, cells):
+            if cell:
+                _text(page, cell, 520 if cell == "ZZ99999" else x + 2, y)
+        y += 10
+    return page
+
+
+def index_page():
+    """A table-of-contents page, which the Sennebogen pre-classifier should skip."""
+    page = Page()
+    _text(page, "Inhaltsverzeichnis / Index", 40, 40, size=12, bold=True)
+    for i in range(30):
+        _text(page, f"Baugruppe {i} ........ {i + 3}", 40, 80 + i * 14)
+    return page
+
+
+def drawing_page(rng, strokes=300):
+    """An exploded-view style page: many short curves and a few position labels."""
+    page = Page()
+    for _ in range(strokes):
+        x, y = rng.uniform(60, 500), rng.uniform(100, 700)
+        points = [(x + rng.uniform(-20, 20), y + rng.uniform(-20, 20)) for _ in range(4)]
+        Shape(points, line_width=1).paint((min(p[0] for p in points), min(p[1] for p in points), 40, 40), page)
+    for i in range(12):
+        _text(page, str(i + 1), rng.uniform(60, 500), rng.uniform(100, 700))
+    return page
+
+
+def build_manual(path, kind, pages, seed=0, drawing_every=None):
+    """
+    Writes a synthetic manual of the given kind to path.
+
+    Args:
+        kind: one of KINDS
+        pages: total number of pages
+        seed: random seed for the page content
+        drawing_every: for Sennebogen manuals, start with an index page and
+            make every n-th page a drawing, like real manuals; None for
+            parts pages only
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown manual kind {kind!r}; expected one of {', '.join(KINDS)}")
+    rng = random.Random(seed)
+    document = Document()
+    for n in range(pages):
+        if kind == LIEBHERR:
+            page = liebherr_page(rng)
+        elif drawing_every and n == 0:
+            page = index_page()
+        elif drawing_every and n % drawing_every == 0:
+            page = drawing_page(rng)
+        else:
+            page = sennebogen_page(SENNEBOGEN_KINDS[kind], rng)
+        document.append_page(page)
+    PDF.write(document, path)
+    return path
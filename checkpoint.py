@@ -0,0 +1,198 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+from file_utils import atomic_write_json, file_sha256
+
+CHECKPOINT_DIR = "extraction_jobs"
+# Job directories untouched for this long are abandoned and get removed
+MAX_JOB_AGE = 7 * 24 * 3600
+MANIFEST_FILE = "manifest.json"
+HOLDERS_DIR = "holders"
+# A job lock held longer than this belongs to a crashed process and is broken
+LOCK_TIMEOUT = 30
+
+
+@contextmanager
+def _job_lock(job_dir, timeout=LOCK_TIMEOUT):
+    """
+    Cross-process lock on a job directory's holder list: a lock file next to
+    the directory, created with O_EXCL, so it works wherever the job
+    directory does.
+    """
+    lock_path = os.path.normpath(job_dir) + ".lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                print(f"⚠️ Breaking stale checkpoint lock {lock_path}")
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+                deadline = time.monotonic() + timeout
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+class PageCheckpoint:
+    """
+    Per-page checkpoints of one extraction job.
+
+    Every page that finished without an error is stored as pages/<n>.json
+    (n is the 0-based page index) holding its extracted rows; a rerun loads
+    those pages instead of parsing them again. Pages are written atomically,
+    so a crash mid-page leaves that page simply missing. The job directory
+    can be shared with worker processes by passing its path.
+
+    Runs of the same document at the same time share the job directory.
+    Each run that opened it (see open_job) is registered as a holder, and
+    the directory is only removed when the last holder finishes.
+    """
+
+    def __init__(self, job_dir, holder=None):
+        self.job_dir = job_dir
+        self.pages_dir = os.path.join(job_dir, "pages")
+        self.holders_dir = os.path.join(job_dir, HOLDERS_DIR)
+        self.holder = holder
+
+    def _page_path(self, page_number):
+        return os.path.join(self.pages_dir, f"{page_number:05d}.json")
+
+    def completed_pages(self):
+        if not os.path.isdir(self.pages_dir):
+            return set()
+        return {int(name[:-5]) for name in os.listdir(self.pages_dir) if name.endswith(".json")}
+
+    def load(self, page_number):
+        """Rows stored for the page, or None when it has not been completed."""
+        try:
+            with open(self._page_path(page_number), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable checkpoint for page {page_number + 1}: {e}")
+            return None
+
+    def save(self, page_number, rows):
+        """
+        Stores a finished page; returns False, after a warning, when it cannot
+        be written. A missing checkpoint only costs re-extracting the page on
+        a rerun, so it never fails the conversion.
+        """
+        try:
+            atomic_write_json(self._page_path(page_number), rows)
+            return True
+        except OSError as e:
+            print(f"⚠️ Could not checkpoint page {page_number + 1}: {e}")
+            return False
+
+    def _drop_holder(self):
+        if self.holder:
+            try:
+                os.remove(os.path.join(self.holders_dir, self.holder))
+            except FileNotFoundError:
+                pass
+            self.holder = None
+
+    def release(self):
+        """Stops holding the job without removing it, e.g. after a failed run, so a rerun can resume it."""
+        with _job_lock(self.job_dir):
+            self._drop_holder()
+
+    def finish(self):
+        """Releases the job once the output has been written, removing its directory if no other run holds it."""
+        with _job_lock(self.job_dir):
+            self._drop_holder()
+            try:
+                others = os.listdir(self.holders_dir)
+            except FileNotFoundError:
+                others = []
+            if not others:
+                shutil.rmtree(self.job_dir, ignore_errors=True)
+
+
+def prune_stale_jobs(root=CHECKPOINT_DIR, max_age=MAX_JOB_AGE):
+    """Removes job directories under root whose manifest has not been touched for max_age seconds."""
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - max_age
+    for extractor in os.listdir(root):
+        extractor_dir = os.path.join(root, extractor)
+        if not os.path.isdir(extractor_dir):
+            continue
+        for job in os.listdir(extractor_dir):
+            job_dir = os.path.join(extractor_dir, job)
+            if not os.path.isdir(job_dir):
+                continue
+            manifest = os.path.join(job_dir, MANIFEST_FILE)
+            try:
+                if os.path.getmtime(manifest if os.path.exists(manifest) else job_dir) < cutoff:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+            except OSError:
+                continue
+
+
+def open_job(pdf_path, extractor, version, settings=(), root=CHECKPOINT_DIR):
+    """
+    Opens (or resumes) the checkpoint job for a document.
+
+    The job directory is keyed by the SHA-256 of the PDF bytes, the extractor
+    name, its version and settings that change the output (e.g. the column
+    detection option), so a changed file or extractor never resumes from
+    stale rows. The manifest records the same key for inspection. The caller
+    becomes one of the job's holders and must end with finish() or, when
+    the run fails, release().
+
+    Returns:
+        PageCheckpoint for the job.
+    """
+    prune_stale_jobs(root)
+    doc_hash = file_sha256(pdf_path)
+    name = "-".join([doc_hash[:32], f"v{version}"] + [str(setting) for setting in settings])
+    job_dir = os.path.join(root, extractor, name)
+    with _job_lock(job_dir):
+        return _register(job_dir, doc_hash, extractor, version, settings)
+
+
+def _register(job_dir, doc_hash, extractor, version, settings):
+    job = PageCheckpoint(job_dir, holder=f"{os.getpid()}-{uuid.uuid4().hex}")
+    os.makedirs(job.pages_dir, exist_ok=True)
+    os.makedirs(job.holders_dir, exist_ok=True)
+    with open(os.path.join(job.holders_dir, job.holder), "w") as f:
+        f.write(str(time.time()))
+
+    manifest_path = os.path.join(job_dir, MANIFEST_FILE)
+    manifest = {
+        "doc_hash": doc_hash,
+        "extractor": extractor,
+        "version": version,
+        "settings": [str(setting) for setting in settings],
+        "created": time.time(),
+    }
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r") as f:
+                manifest["created"] = json.load(f).get("created", manifest["created"])
+        except (OSError, ValueError):
+            pass
+        completed = len(job.completed_pages())
+        if completed:
+            print(f"♻️ Resuming {extractor} job: {completed} page(s) already extracted")
+    manifest["updated"] = time.time()
+    atomic_write_json(manifest_path, manifest)
+    return job
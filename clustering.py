@@ -0,0 +1,85 @@
+import numpy as np
+
+# Widens searchsorted windows so float noise never drops a neighbour that the
+# exact tolerance check would accept.
+_EPS = 1e-9
+
+
+def cluster_chained(values, tolerance):
+    """
+    Sorts values and splits them wherever the gap to the previous value is
+    larger than tolerance, so a run of close values stays one cluster even if
+    its ends are far apart.
+
+    Returns a list of sorted numpy arrays, one per cluster.
+    """
+    values = np.sort(np.asarray(values, dtype=float))
+    if values.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(values) > tolerance) + 1
+    return np.split(values, breaks)
+
+
+def cluster_centers(values, tolerance):
+    """Rounded mean of every chained cluster of values, as a sorted list of ints."""
+    return [int(x) for x in np.round([c.mean() for c in cluster_chained(values, tolerance)])]
+
+
+def filter_min_gap(values, gap):
+    """
+    Sweeps the sorted values and keeps one whenever it lies more than gap past
+    the last value kept; the first value is always kept.
+    """
+    values = np.sort(np.asarray(values))
+    kept = []
+    i = 0
+    while i < values.size:
+        kept.append(values[i].item())
+        i = int(np.searchsorted(values, values[i] + gap, side="right"))
+    return kept
+
+
+def merge_boxes(boxes, box_tolerance, stack_tolerance):
+    """
+    Groups boxes that describe the same column: their x0 and x1 agree within
+    box_tolerance and their top or bottom agree within stack_tolerance.
+
+    Like the original pairwise pass, boxes are taken in input order and each
+    unused box collects the later unused boxes that match it; candidates are
+    found with a sorted sweep over x0 instead of comparing every pair.
+
+    Args:
+        boxes: (n, 4) array of x0, top, x1, bottom
+
+    Returns:
+        List of index arrays, one per group, in the order groups were formed.
+    """
+    boxes = np.asarray(boxes, dtype=float)
+    order = np.argsort(boxes[:, 0], kind="stable")
+    sorted_x0 = boxes[order, 0]
+    used = np.zeros(len(boxes), dtype=bool)
+    groups = []
+    for i in range(len(boxes)):
+        if used[i]:
+            continue
+        x0, top, x1, bottom = boxes[i]
+        lo = np.searchsorted(sorted_x0, x0 - box_tolerance - _EPS, side="left")
+        hi = np.searchsorted(sorted_x0, x0 + box_tolerance + _EPS, side="right")
+        candidates = order[lo:hi]
+        candidates = candidates[(candidates > i) & ~used[candidates]]
+        c = boxes[candidates]
+        match = (
+            (np.abs(c[:, 0] - x0) <= box_tolerance)
+            & (np.abs(c[:, 2] - x1) <= box_tolerance)
+            & ((np.abs(c[:, 1] - top) <= stack_tolerance) | (np.abs(c[:, 3] - bottom) <= stack_tolerance))
+        )
+        members = np.sort(candidates[match])
+        used[i] = True
+        used[members] = True
+        groups.append(np.concatenate(([i], members)).astype(int))
+    return groups
+
+
+def unique_rounded(values, decimals=1):
+    """Sorted unique values after rounding, as a list of floats."""
+    return np.unique(np.round(np.asarray(values, dtype=float), decimals)).tolist()
@@ -0,0 +1,105 @@
+import xlsxwriter
+
+from file_utils import spooled_output
+
+
+def content_lengths(df):
+    """Length of the longest non-empty cell text of every column (0 for empty columns)."""
+    lengths = []
+    for i in range(df.shape[1]):
+        values = df.iloc[:, i]
+        values = values[values.notna() & (values != "")]
+        lengths.append(int(values.astype(str).str.len().max()) if len(values) else 0)
+    return lengths
+
+
+class StyledExcelWriter:
+    """
+    Writes a table to an xlsx workbook chunk by chunk: bold header, thin
+    borders and centered (optionally wrapped) cells, with column widths
+    fitted to the content once every chunk has been seen.
+
+    xlsxwriter's constant_memory mode flushes each row as soon as it is
+    written, and the column widths are only emitted when the workbook is
+    closed, so memory stays flat however many rows the manual has.
+    """
+
+    def __init__(self, columns, output_path=None, sheet_name="Combined Output",
+                 max_col_width=None, wrap_text=False, padding=2):
+        self.columns = list(columns)
+        self.output_path = output_path
+        self.max_col_width = max_col_width
+        self.padding = padding
+        self.target = output_path if output_path else spooled_output()
+        self.workbook = xlsxwriter.Workbook(self.target, {
+            "constant_memory": True,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+        })
+        self.sheet = self.workbook.add_worksheet(sheet_name)
+
+        style = {"border": 1, "align": "center", "valign": "vcenter", "text_wrap": wrap_text}
+        self.header_format = self.workbook.add_format(dict(style, bold=True))
+        self.cell_format = self.workbook.add_format(style)
+
+        self.sheet.write_row(0, 0, [str(col) for col in self.columns], self.header_format)
+        self.widths = [len(str(col)) for col in self.columns]
+        self.row_number = 1
+        self.closed = False
+
+    def write(self, df):
+        """Appends the rows of df (columns in the writer's order); None or an empty frame is a no-op."""
+        if df is None or df.empty:
+            return
+        self.widths = [max(width, longest) for width, longest in zip(self.widths, content_lengths(df))]
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            self.sheet.write_row(self.row_number, 0, row, self.cell_format)
+            self.row_number += 1
+
+    def add_sheet(self, name, df):
+        """Adds a small extra sheet holding df, styled like the main one and fitted to its content."""
+        sheet = self.workbook.add_worksheet(name)
+        sheet.write_row(0, 0, [str(col) for col in df.columns], self.header_format)
+        values = df.astype(object).where(df.notna(), None)
+        for row_number, row in enumerate(values.itertuples(index=False, name=None), start=1):
+            sheet.write_row(row_number, 0, row, self.cell_format)
+        widths = [max(len(str(col)), longest) for col, longest in zip(df.columns, content_lengths(df))]
+        for i, width in enumerate(widths):
+            width += self.padding
+            if self.max_col_width is not None:
+                width = min(width, self.max_col_width)
+            sheet.set_column(i, i, width)
+
+    def close(self):
+        """
+        Finishes the workbook.
+
+        Returns:
+            output_path when one was given, otherwise a file object with the
+            workbook (see file_utils.spooled_output) positioned at the start.
+        """
+        if not self.closed:
+            self.closed = True
+            for i, width in enumerate(self.widths):
+                width += self.padding
+                if self.max_col_width is not None:
+                    width = min(width, self.max_col_width)
+                self.sheet.set_column(i, i, width)
+            self.workbook.close()
+        if self.output_path:
+            return self.output_path
+        self.target.seek(0)
+        return self.target
+
+
+def write_styled_excel(df, sheet_name="Combined Output", max_col_width=None, wrap_text=False):
+    """
+    Writes df to an xlsx workbook in one streaming pass (see StyledExcelWriter).
+
+    Returns:
+        File object with the workbook, positioned at the start.
+    """
+    writer = StyledExcelWriter(df.columns, sheet_name=sheet_name, max_col_width=max_col_width, wrap_text=wrap_text)
+    writer.write(df)
+    return writer.close()
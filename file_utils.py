@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# In-memory outputs roll over to a temp file on disk past this size
+SPOOL_BYTES = 64 * 1024 * 1024
+
+
+def atomic_write_json(path, data):
+    """Writes data as JSON through a temp file and os.replace, so a crash mid-write never leaves a truncated file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def spooled_output(max_size=SPOOL_BYTES):
+    """Binary file object kept in memory up to max_size bytes and spooled to a temp file beyond that."""
+    return tempfile.SpooledTemporaryFile(max_size=max_size)
+
+
+def file_sha256(pdf_path, chunk_size=1 << 20):
+    """
+    SHA-256 hex digest of a file, given as a path or a file-like object
+    (e.g. a Streamlit upload). File objects are rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    if isinstance(pdf_path, (str, os.PathLike)):
+        with open(pdf_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    pdf_path.seek(0)
+    for chunk in iter(lambda: pdf_path.read(chunk_size), b""):
+        digest.update(chunk)
+    pdf_path.seek(0)
+    return digest.hexdigest()
+
+
+def spool_to_temp_file(pdf_path):
+    """
+    Worker processes open the PDF themselves, so file objects (uploads) are
+    written to a temp file once; paths are used as they are.
+
+    Returns:
+        (path to open, temp file to remove afterwards or None)
+    """
+    if isinstance(pdf_path, (str, os.PathLike)):
+        return pdf_path, None
+    if hasattr(pdf_path, "seek"):
+        pdf_path.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        shutil.copyfileobj(pdf_path, tmp)
+    return tmp.name, tmp.name
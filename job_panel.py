@@ -0,0 +1,103 @@
+import json
+
+import streamlit as st
+
+from jobs import DONE, FAILED, FINISHED, JobStore, ensure_worker
+
+# Seconds between refreshes of a page's job list while one of its jobs is unfinished
+REFRESH_SECONDS = 2
+LOG_LINES = 200
+
+
+@st.cache_resource
+def job_store():
+    return JobStore()
+
+
+def _remembered():
+    """Job ids of this browser session, kept in the URL too so a refresh does not lose them."""
+    if "jobs" not in st.session_state:
+        ids = st.query_params.get("jobs", "")
+        st.session_state.jobs = [job_id for job_id in ids.split(",") if job_id]
+    return st.session_state.jobs
+
+
+def submit_job(section, kind, params=None, input_file=None, result_name=None, mime=None, secrets=None):
+    """Queues a background job for a page section and starts the worker if needed; returns the job id."""
+    store = job_store()
+    params = dict(params or {}, section=section, mime=mime)
+    job_id = store.submit(
+        kind, params, input_file, getattr(input_file, "name", None), result_name, secrets
+    )
+    ensure_worker(store.root)
+    ids = _remembered()
+    ids.append(job_id)
+    st.query_params["jobs"] = ",".join(ids)
+    return job_id
+
+
+def _show_result(store, job):
+    data = store.result(job["id"])
+    if data is None:
+        return
+    if job["kind"] == "portal_cart":
+        for item, status in json.loads(data).items():
+            if "not found" in status.lower():
+                st.error(f"Item {item}: {status}")
+            else:
+                st.warning(f"Item {item}: {status}")
+        return
+    if not data:
+        st.error("No tables found in the PDF.")
+        return
+    st.download_button(
+        label=f"Download {job['result_name']}",
+        data=data,
+        file_name=job["result_name"],
+        mime=job["params"].get("mime"),
+        key=f"download-{job['id']}"
+    )
+
+
+def _show_jobs(section):
+    store = job_store()
+    jobs = [job for job in (store.get(job_id) for job_id in _remembered()) if job]
+    jobs = [job for job in jobs if job["params"].get("section") == section]
+    for job in reversed(jobs):
+        name = job["input_name"] or job["kind"]
+        with st.container(border=True):
+            if job["status"] == DONE:
+                st.success(f"✅ {name}: finished")
+            elif job["status"] == FAILED:
+                st.error(f"❌ {name}: {job['error']}")
+            else:
+                st.info(f"⏳ {name}: {job['status']}")
+            lines = [message for _, message in store.logs(job["id"])][-LOG_LINES:]
+            if lines:
+                with st.expander("Log"):
+                    st.code("\n".join(lines), language=None)
+            if job["status"] == DONE:
+                _show_result(store, job)
+    return any(job["status"] not in FINISHED for job in jobs)
+
+
+def show_jobs(section):
+    """
+    Lists this session's jobs for a page section: status, log and, once
+    finished, the download. Refreshes itself while a job is still running.
+    """
+    store = job_store()
+    unfinished = any(
+        job and job["params"].get("section") == section and job["status"] not in FINISHED
+        for job in (store.get(job_id) for job_id in _remembered())
+    )
+    if not unfinished or not hasattr(st, "fragment"):
+        if _show_jobs(section):
+            st.button("Refresh", key=f"refresh-{section}")
+        return
+
+    @st.fragment(run_every=REFRESH_SECONDS)
+    def panel():
+        _show_jobs(section)
+
+    panel()
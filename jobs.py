@@ -0,0 +1,437 @@
+"""
+Background jobs for the Streamlit pages.
+
+Pages submit long work (extractions, Sortly syncs, portal lookups) to a
+SQLite job table instead of running it inside the session, then poll it.
+A local worker process, started on demand by ensure_worker(), claims queued
+jobs and runs each one in a child process of its own; everything the job
+prints becomes its log. Inputs, results and logs live on disk, so a job
+keeps running when the browser is refreshed and can be picked up again
+from any session.
+
+Run the worker by hand with:
+
+    python -m jobs
+"""
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import closing
+
+JOB_DIR = "background_jobs"
+DB_FILE = "jobs.db"
+# Jobs (with their inputs, results and logs) older than this are removed
+MAX_JOB_AGE = 7 * 24 * 3600
+# Jobs run side by side; each may use processes of its own (e.g. extraction workers)
+MAX_RUNNING_JOBS = 2
+POLL_INTERVAL = 1.0
+# A worker that has not checked in for this long is considered gone
+HEARTBEAT_TIMEOUT = 15
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    secrets TEXT,
+    input_name TEXT,
+    result_name TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS job_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_logs_job ON job_logs (job_id, id);
+CREATE TABLE IF NOT EXISTS worker (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pid INTEGER,
+    heartbeat REAL
+);
+"""
+
+
+class JobStore:
+    """
+    The job table and the files of each job (job_dir/<id>/input, result).
+
+    Every call opens its own short-lived connection, so one store can be
+    used from Streamlit's session threads and the worker alike. Secrets
+    (e.g. portal credentials) are kept in a column of their own that is
+    cleared the moment a worker claims the job.
+    """
+
+    def __init__(self, root=JOB_DIR):
+        self.root = root
+        self.db_path = os.path.join(root, DB_FILE)
+        os.makedirs(root, exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # autocommit; multi-statement updates take the write lock with BEGIN IMMEDIATE
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def input_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), "input")
+
+    def result_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), "result")
+
+    def submit(self, kind, params=None, input_file=None, input_name=None, result_name=None, secrets=None):
+        """
+        Queues a job and returns its id.
+
+        input_file (a path or file-like object) is copied into the job
+        directory; handlers find it at input_path(job_id).
+        """
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        if input_file is not None:
+            if isinstance(input_file, (str, os.PathLike)):
+                shutil.copyfile(input_file, self.input_path(job_id))
+            else:
+                input_file.seek(0)
+                with open(self.input_path(job_id), "wb") as f:
+                    shutil.copyfileobj(input_file, f)
+                input_file.seek(0)
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, params, secrets, input_name, result_name, status, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params or {}), json.dumps(secrets) if secrets else None,
+                 input_name, result_name, QUEUED, time.time())
+            )
+        return job_id
+
+    def get(self, job_id):
+        """The job as a dict (params decoded, secrets left out), or None."""
+        with closing(self._connect()) as db:
+            db.row_factory = sqlite3.Row
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job.pop("secrets")
+        return job
+
+    def claim(self):
+        """
+        Marks the oldest queued job as running and returns (job, secrets),
+        or None when the queue is empty. The stored secrets are cleared.
+        """
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT id, secrets FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            job_id, secrets = row
+            db.execute(
+                "UPDATE jobs SET status = ?, started = ?, secrets = NULL WHERE id = ?", (RUNNING, time.time(), job_id)
+            )
+            db.execute("COMMIT")
+        return self.get(job_id), json.loads(secrets) if secrets else None
+
+    def finish(self, job_id, error=None):
+        with closing(self._connect()) as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ? AND status = ?",
+                (FAILED if error else DONE, error, time.time(), job_id, RUNNING)
+            )
+
+    def log(self, job_id, message):
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT INTO job_logs (job_id, created, message) VALUES (?, ?, ?)", (job_id, time.time(), message)
+            )
+
+    def logs(self, job_id, after=0):
+        """Log lines of a job as (log id, message), oldest first; pass the last id seen as after to get only new ones."""
+        with closing(self._connect()) as db:
+            return db.execute(
+                "SELECT id, message FROM job_logs WHERE job_id = ? AND id > ? ORDER BY id", (job_id, after)
+            ).fetchall()
+
+    def result(self, job_id):
+        """The result file's bytes, or None when the job produced none."""
+        try:
+            with open(self.result_path(job_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def recover(self):
+        """
+        Re-queues jobs left running by a worker that died. Jobs that were
+        given secrets cannot be re-run (the secrets are gone) and fail.
+        """
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            for job_id, kind in db.execute("SELECT id, kind FROM jobs WHERE status = ?", (RUNNING,)).fetchall():
+                if JOB_HANDLERS.get(kind, (None, False))[1]:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+                        (FAILED, "The worker stopped while the job was running; please submit it again.",
+                         time.time(), job_id)
+                    )
+                else:
+                    db.execute("UPDATE jobs SET status = ?, started = NULL WHERE id = ?", (QUEUED, job_id))
+            db.execute("COMMIT")
+
+    def prune(self, max_age=MAX_JOB_AGE):
+        """Removes finished jobs older than max_age seconds, with their files and logs."""
+        cutoff = time.time() - max_age
+        with closing(self._connect()) as db:
+            old = [row[0] for row in db.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND created < ?", (*FINISHED, cutoff)
+            ).fetchall()]
+            for job_id in old:
+                db.execute("DELETE FROM job_logs WHERE job_id = ?", (job_id,))
+                db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        for job_id in old:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def heartbeat(self, pid):
+        """
+        Records that worker pid is alive. Returns False when another live
+        worker already holds the store, in which case pid should exit.
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT pid, heartbeat FROM worker WHERE id = 1").fetchone()
+            if row and row[0] != pid and row[1] is not None and now - row[1] < HEARTBEAT_TIMEOUT:
+                db.execute("COMMIT")
+                return False
+            db.execute("INSERT OR REPLACE INTO worker (id, pid, heartbeat) VALUES (1, ?, ?)", (pid, now))
+            db.execute("COMMIT")
+        return True
+
+    def worker_alive(self):
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT heartbeat FROM worker WHERE id = 1").fetchone()
+        return bool(row and row[0] is not None and time.time() - row[0] < HEARTBEAT_TIMEOUT)
+
+
+# --- Job handlers (run in the job's child process) ---
+#
+# Each handler takes (params, input_path, secrets) and returns the result:
+# bytes or a file-like object (stored as the result file), any other
+# JSON-serializable value (stored as JSON), or None. Whatever it prints is
+# the job's log.
+
+def _convert(params, input_path, secrets):
+    """A single-file conversion (see batch.convert_file), through the result cache."""
+    from batch import conversion_settings, convert_file
+    from checkpoint import CHECKPOINT_DIR
+    from result_cache import Uncached, cached_conversion
+
+    extractor, option, output_format = params["extractor"], params.get("option"), params.get("format")
+    version, settings, extension = conversion_settings(extractor, option, output_format)
+
+    def compute():
+        output_path = f"{input_path}.{extension}"
+        review = []
+        convert_file(
+            input_path, extractor, option, output_format, output_path,
+            workers=params.get("workers", 1), checkpoint_dir=CHECKPOINT_DIR, review=review
+        )
+        with open(output_path, "rb") as f:
+            data = f.read()
+        # an output missing pages is not cached, so the next run tries them again
+        return Uncached(data) if review else data
+
+    return cached_conversion(input_path, extractor, version, settings, compute)
+
+
+def _batch(params, input_path, secrets):
+    """A batch conversion; the input is a ZIP of the uploaded PDFs, in the order of params["files"]."""
+    import zipfile
+    from batch import run_batch
+
+    def report(i, status, message=""):
+        print(f"{params['files'][i][0]}: {status}" + (f" ({message})" if message else ""))
+
+    with zipfile.ZipFile(input_path) as zf:
+        files = [(name, zf.open(str(i)), conversion) for i, (name, conversion) in enumerate(params["files"])]
+        archive, _ = run_batch(files, params["format"], params.get("workers", 2), report)
+    return archive
+
+
+def _sortly_update(params, input_path, secrets):
+    from sortly_backend import run_update_process
+    run_update_process(secrets["api_token"], input_path, print, params.get("full_sync", False))
+
+
+def _portal_info(params, input_path, secrets):
+    import senn_web
+    workbook = senn_web.add_info(input_path, secrets["username"], secrets["password"])
+    if not workbook:
+        # the job fails with the message the page showed before jobs ran in the background
+        raise ValueError("Wrong PDF format")
+    return workbook
+
+
+def _portal_cart(params, input_path, secrets):
+    import senn_web
+    statuses = senn_web.add_to_cart(input_path, secrets["username"], secrets["password"])
+    if not statuses:
+        raise ValueError("Failed to process the file.")
+    return statuses
+
+
+# kind -> (handler, whether the job needs secrets)
+JOB_HANDLERS = {
+    "convert": (_convert, False),
+    "batch": (_batch, False),
+    "sortly_update": (_sortly_update, True),
+    "portal_info": (_portal_info, True),
+    "portal_cart": (_portal_cart, True),
+}
+
+
+def run_job(store, job_id, secrets=None):
+    """Runs one claimed job in this process and records its result or error."""
+    job = store.get(job_id)
+    handler, _ = JOB_HANDLERS[job["kind"]]
+    input_path = store.input_path(job_id)
+    try:
+        result = handler(job["params"], input_path if os.path.exists(input_path) else None, secrets)
+        if hasattr(result, "read"):
+            result.seek(0)
+            result = result.read()
+        if result is not None:
+            if not isinstance(result, bytes):
+                result = json.dumps(result).encode("utf-8")
+            with open(store.result_path(job_id), "wb") as f:
+                f.write(result)
+    except Exception as e:
+        traceback.print_exc()
+        store.finish(job_id, error=str(e) or type(e).__name__)
+        return
+    store.finish(job_id)
+
+
+# --- Worker ---
+
+def _pipe_log(store, job_id, stream):
+    for line in stream:
+        line = line.rstrip("\n")
+        if line.strip():
+            store.log(job_id, line)
+
+
+def _start_job(store, job, secrets):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "jobs", "--run", job["id"], "--root", store.root],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        # progress bars update at most every few seconds, so they do not flood the log
+        env=dict(os.environ, PYTHONUNBUFFERED="1", TQDM_MININTERVAL="5"),
+    )
+    # secrets go to the child over its stdin, never through the command line or the database
+    process.stdin.write(json.dumps(secrets))
+    process.stdin.close()
+    reader = threading.Thread(target=_pipe_log, args=(store, job["id"], process.stdout), daemon=True)
+    reader.start()
+    return process, reader
+
+
+def run_worker(root=JOB_DIR, max_running=MAX_RUNNING_JOBS, poll_interval=POLL_INTERVAL):
+    """Claims and runs jobs until killed; exits at once if another worker is already serving root."""
+    store = JobStore(root)
+    pid = os.getpid()
+    if not store.heartbeat(pid):
+        print("Another job worker is running; exiting.")
+        return
+    store.recover()
+    store.prune()
+    running = {}
+    while True:
+        for job_id, (process, reader) in list(running.items()):
+            if process.poll() is None:
+                continue
+            reader.join()
+            # a child that crashed or was killed never recorded an outcome
+            store.finish(job_id, error=f"The job process exited with code {process.returncode}")
+            del running[job_id]
+        while len(running) < max_running:
+            claimed = store.claim()
+            if claimed is None:
+                break
+            job, secrets = claimed
+            running[job["id"]] = _start_job(store, job, secrets)
+        if not store.heartbeat(pid):
+            return
+        time.sleep(poll_interval)
+
+
+_worker_lock = threading.Lock()
+
+
+def ensure_worker(root=JOB_DIR):
+    """Starts a detached worker process for root unless one is alive."""
+    store = JobStore(root)
+    with _worker_lock:
+        if store.worker_alive():
+            return
+        subprocess.Popen(
+            [sys.executable, "-m", "jobs", "--root", root],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        # wait for the first heartbeat so the next call does not start a second worker
+        deadline = time.time() + HEARTBEAT_TIMEOUT
+        while time.time() < deadline and not store.worker_alive():
+            time.sleep(0.2)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=JOB_DIR)
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.run:
+        run_job(JobStore(args.root), args.run, json.loads(sys.stdin.read() or "null"))
+    else:
+        run_worker(args.root)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,103 +1,236 @@
 import pdfplumber
 import pandas as pd
 from tqdm import tqdm
-from io import BytesIO
-from openpyxl.styles import Alignment, Font, Border, Side
 import re
+from typing import NamedTuple
+from table_output import XLSX, open_table_writer
+from checkpoint import CHECKPOINT_DIR, open_job
+from profiling import DOCUMENT, NULL_PROFILER, StageProfiler, print_peak_memory
+from page_watchdog import (
+    DONE, FAILED, MAX_PAGE_OBJECTS, PAGE_TIMEOUT, RESUMED, check_object_budget, watch_document, write_review_sheet
+)
 
-def extract_tables_(pdf_path):
-    combined_data = []
-    order_number = 0
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_number, page in enumerate(tqdm(pdf.pages, desc="Processing Pages")):
-            try:
-                height = page.height
-                width = page.width
-                cropped_page = page.within_bbox((0, height/2, width, height))
-                tables = cropped_page.extract_table(table_settings={
-                            "join_tolerance": 7,  
-                            "intersection_tolerance": 8,  
-                            "horizontal_strategy": "text",
-                            "vertical_strategy": "lines_strict",
-                            "snap_x_tolerance": 5,
-                            "explicit_vertical_lines": [40, 555]
-                        })
-                
-                if tables:
-                    order_number=tables[0][5][7:].replace(" ", "")
-                    df = pd.DataFrame(tables[3:])
-                    if df.shape[1] > 5:
-                        df = df.drop(df.columns[[4, 5]], axis=1)
-                    
-                    df = df[~(df.apply(lambda row: all(cell == "" for cell in row), axis=1))] 
-                    df = df[~df[0].astype(str).str.contains("Page", na=False)]
-
-                    data = df.values.tolist()
-                    combined_data.extend(data)
-            except Exception as e:
-                print(f"Error on pathge {page_number+1}: {e}")
-    # print(combined_data)
-    for index_r, row in enumerate(combined_data):
-        # order no.
-        combined_data[index_r][1] = combined_data[index_r][1].replace(' ', "")
-        # quantity changes
-        combined_data[index_r][2] = combined_data[index_r][2].replace('.', "")
-        combined_data[index_r][2] = combined_data[index_r][2].replace(',', '.')
-        combined_data[index_r][2] = float(combined_data[index_r][2])
-        # group #
-        if "->" in combined_data[index_r][3]:
-            match = re.search(r"\(([^)]+)\)", combined_data[index_r][3])
-            extracted_number = match.group(1)[9:].replace(" ", "")
-            print(extracted_number)
-            combined_data[index_r].append(extracted_number)
-        else:
-            combined_data[index_r].append(" ")
-        # assembly
-        combined_data[index_r].append(order_number)
-    
-    combined_df = ""
-    output_stream = ""
-    combined_df = pd.DataFrame(combined_data, columns=["Pos", "Order Nr.", "Quantity", "Designation", "Serial from", "Serial to.", "Group #", "Assembly"])
-    output_stream = BytesIO()
-
-    with pd.ExcelWriter(output_stream, engine='openpyxl') as writer:
-        combined_df.to_excel(writer, index=False, sheet_name='Combined Output')
-    
-    output_stream.seek(0)
-    from openpyxl import load_workbook
-    wb = load_workbook(output_stream)
-    sheet = wb.active
-
-    for column in sheet.columns:
-        max_length = 0
-        column_letter = column[0].column_letter 
-        for cell in column:
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except Exception:
-                pass
-        adjusted_width = max_length + 2  
-        sheet.column_dimensions[column_letter].width = adjusted_width
-
-    for cell in sheet[1]: 
-        cell.font = Font(bold=True)
-
-    for row in sheet.iter_rows():
-        for cell in row:
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+# Bump when a change alters the extracted rows, so checkpoints of older runs are not resumed
+EXTRACTOR_VERSION = 2
+
+COLUMNS = ["Pos", "Order Nr.", "Quantity", "Designation", "Serial from", "Serial to.", "Group #", "Assembly"]
+
+# "Bolt -> (Group no. 63 141)": the group number is in the parentheses, after "Group no."
+GROUP_PATTERN = re.compile(r"\(([^)]+)\)")
+GROUP_PREFIX_LENGTH = len("Group no.")
+
+
+class PartRecord(NamedTuple):
+    """One parts-list row; a NamedTuple, so records carry no per-instance __dict__."""
+    pos: str
+    order_number: str
+    quantity: float
+    designation: str
+    serial_from: str
+    serial_to: str
+    group: str
+    assembly: str
+
+
+def normalize_rows(df, order_number):
+    """
+    Cleans up one page's table (columns in Liebherr order, Pos to Serial to.)
+    with vectorized string operations: order numbers without spaces, German
+    quantities as floats (NaN when unreadable), the group number taken from
+    "-> (...)" designations and the page's order number as the assembly.
+
+    Returns a list of PartRecord.
+    """
+    pos, order, quantity, designation, serial_from, serial_to = (df.iloc[:, i] for i in range(6))
+    order = order.str.replace(" ", "", regex=False)
+    quantity = pd.to_numeric(
+        quantity.str.replace(".", "", regex=False).str.replace(",", ".", regex=False),
+        errors="coerce"
+    ).astype(float)
+    group = (
+        designation.str.extract(GROUP_PATTERN, expand=False)
+        .str[GROUP_PREFIX_LENGTH:]
+        .str.replace(" ", "", regex=False)
     )
-    for row in sheet.iter_rows():
-        for cell in row:
-            cell.border = thin_border
-
-    output_stream = BytesIO()
-    wb.save(output_stream)
-    output_stream.seek(0)
-    return output_stream
\ No newline at end of file
+    group = group.where(designation.str.contains("->", regex=False), " ").fillna(" ")
+    return [
+        PartRecord(*values, order_number)
+        for values in zip(pos, order, quantity, designation, serial_from, serial_to, group)
+    ]
+
+
+def extract_page_rows(page, page_number=0, profiler=NULL_PROFILER, max_objects=None):
+    """
+    Extracts the parts of one page as PartRecords; an empty list when the page has no table.
+
+    With max_objects, pages holding more parsed objects than that raise
+    page_watchdog.PageBudgetExceeded before the table finder runs.
+    """
+    with profiler.stage(page_number, "parse"):
+        # pdfminer parses the page on first access to its objects
+        objects = page.objects
+    check_object_budget(page, max_objects)
+    if profiler.enabled:
+        profiler.count(
+            page_number,
+            chars=len(objects.get("char", [])),
+            rects=len(objects.get("rect", [])),
+            lines=len(objects.get("line", [])),
+        )
+    height = page.height
+    width = page.width
+    with profiler.stage(page_number, "crop"):
+        cropped_page = page.within_bbox((0, height/2, width, height))
+    with profiler.stage(page_number, "extract_table"):
+        tables = cropped_page.extract_table(table_settings={
+                "join_tolerance": 7,
+                "intersection_tolerance": 8,
+                "horizontal_strategy": "text",
+                "vertical_strategy": "lines_strict",
+                "snap_x_tolerance": 5,
+                "explicit_vertical_lines": [40, 555]
+            })
+
+    if not tables:
+        return []
+    with profiler.stage(page_number, "normalize"):
+        order_number=tables[0][5][7:].replace(" ", "")
+        df = pd.DataFrame(tables[3:])
+        if df.shape[1] > 5:
+            df = df.drop(df.columns[[4, 5]], axis=1)
+
+        df = df[~(df == "").all(axis=1)]
+        df = df[~df[0].astype(str).str.contains("Page", na=False)]
+
+        records = normalize_rows(df, order_number)
+    profiler.count(page_number, rows=len(records))
+    return records
+
+
+def iter_page_records(pdf, job=None, profiler=NULL_PROFILER):
+    """
+    Yields (page_number, list of PartRecord) page by page, releasing each
+    page once its records are out. Pages stored in job (a PageCheckpoint)
+    are not parsed again; pages that fail are reported and skipped.
+    """
+    for page_number, page in enumerate(tqdm(pdf.pages, desc="Processing Pages")):
+        stored = job.load(page_number) if job else None
+        if stored is not None:
+            yield page_number, [PartRecord(*values) for values in stored]
+            continue
+        try:
+            records = extract_page_rows(page, page_number, profiler)
+        except Exception as e:
+            print(f"Error on pathge {page_number+1}: {e}")
+            continue
+        finally:
+            page.close()
+        if job:
+            job.save(page_number, records)
+        yield page_number, records
+
+
+def watched_page_task(pdf, max_objects=MAX_PAGE_OBJECTS, profile=False):
+    """Builds the page task a page_watchdog worker runs: one page to (records, exported profile or None)."""
+    def task(page, page_number):
+        profiler = StageProfiler() if profile else NULL_PROFILER
+        records = extract_page_rows(page, page_number, profiler, max_objects)
+        return records, profiler.export() if profile else None
+
+    return task
+
+
+def iter_watched_records(pdf_path, page_timeout, max_objects=MAX_PAGE_OBJECTS, job=None, profiler=NULL_PROFILER,
+                         review=None):
+    """
+    Like iter_page_records, but every page runs in a watchdog worker process
+    (see page_watchdog.watch_document); pages over the time or object budget
+    yield no records and are appended to review as (page_number, reason).
+    """
+    task_args = (max_objects, profiler.enabled)
+    for page_number, status, value in watch_document(
+        pdf_path, watched_page_task, task_args, page_timeout, job=job, review=review
+    ):
+        records = []
+        if status == RESUMED:
+            records = [PartRecord(*values) for values in value]
+        elif status == DONE:
+            records, profile = value
+            if profile:
+                profiler.merge(profile)
+            if job:
+                job.save(page_number, records)
+        elif status == FAILED:
+            print(f"Error on pathge {page_number+1}: {value}")
+        yield page_number, records
+
+
+def iter_document_records(pdf_path, job=None, profiler=NULL_PROFILER, page_timeout=None,
+                          max_objects=MAX_PAGE_OBJECTS, review=None):
+    """Yields (page_number, records) for every page, under the page watchdog when page_timeout is set."""
+    if page_timeout is not None:
+        yield from iter_watched_records(pdf_path, page_timeout, max_objects, job, profiler, review)
+        return
+    with pdfplumber.open(pdf_path) as pdf:
+        yield from iter_page_records(pdf, job, profiler)
+
+
+def extract_tables_(
+    pdf_path,
+    output_format=XLSX,
+    output_path=None,
+    checkpoint_dir=CHECKPOINT_DIR,
+    profiler=None,
+    page_timeout=PAGE_TIMEOUT,
+    max_page_objects=MAX_PAGE_OBJECTS,
+    review=None
+):
+    """
+    Extracts the parts tables of a Liebherr manual, writing every page's rows
+    out and releasing the page as soon as it is done, so memory stays flat
+    however long the manual is; the peak is printed at the end.
+
+    Args:
+        pdf_path: path or file-like object of the PDF
+        output_format: "xlsx", "csv" or "parquet"; CSV and Parquet store the
+            quantity as a number and Parquet the assembly as a category
+        output_path: file to write to; by default the output stays in memory
+        checkpoint_dir: where finished pages are checkpointed, so a rerun of
+            the same PDF after a crash resumes instead of starting over; the
+            job is removed once the output is written. None disables it.
+        profiler: a profiling.StageProfiler to record per-page stage times
+            and object counts in; None for no profiling
+        page_timeout: seconds a page may take before it is abandoned; pages
+            then run in a watchdog worker process, and pages over the time or
+            max_page_objects budget are listed on a "Needs Review" sheet
+            instead of stalling the conversion. None runs the pages here,
+            without a budget.
+        max_page_objects: parsed objects (chars, lines, curves, ...) above
+            which a page is not extracted; None for no limit
+        review: list the skipped pages are appended to as (page_number,
+            reason), so callers can tell an incomplete output apart
+
+    Returns:
+        output_path, or a file object with the output (spooled to a temp file
+        once large) when no path was given.
+    """
+    profiler = profiler or NULL_PROFILER
+    job = open_job(pdf_path, "liebherr", EXTRACTOR_VERSION, root=checkpoint_dir) if checkpoint_dir else None
+    writer = open_table_writer(output_format, COLUMNS, output_path, numeric=["Quantity"], categorical=["Assembly"])
+    review = [] if review is None else review
+    try:
+        for _, records in iter_document_records(pdf_path, job, profiler, page_timeout, max_page_objects, review):
+            with profiler.stage(DOCUMENT, "write"):
+                writer.write(pd.DataFrame(records, columns=COLUMNS))
+        write_review_sheet(writer, review)
+    except BaseException:
+        if job:
+            job.release()
+        raise
+    finally:
+        with profiler.stage(DOCUMENT, "write"):
+            output = writer.close()
+    if job:
+        job.finish()
+    print_peak_memory()
+    return output
@@ -0,0 +1,116 @@
+from pdfminer.pdfdocument import PDFNoOutlines
+from pdfminer.pdftypes import PDFObjRef, resolve1
+
+INDEX = "index"
+TABLE = "table"
+DRAWING = "drawing"
+BLANK = "blank"
+
+INDEX_TITLES = ("inhaltsverzeichnis", "index", "contents")
+
+
+def _outline_page_ref(dest, action, doc):
+    """Resolves an outline entry's destination (direct, named or GoTo action) to a page object id."""
+    if dest is None and isinstance(action, dict):
+        dest = action.get("D")
+    dest = resolve1(dest)
+    if isinstance(dest, (str, bytes)):
+        dest = resolve1(doc.get_dest(dest))
+    if isinstance(dest, dict):
+        dest = resolve1(dest.get("D"))
+    if isinstance(dest, list) and dest and isinstance(dest[0], PDFObjRef):
+        return dest[0].objid
+    return None
+
+
+def outline_index_pages(pdf):
+    """
+    Returns the (0-based) page numbers the PDF outline labels as an index or
+    table of contents. Manuals without an outline return an empty set.
+    """
+    page_ids = {page.page_obj.pageid: i for i, page in enumerate(pdf.pages)}
+    index_pages = set()
+    try:
+        outlines = list(pdf.doc.get_outlines())
+    except PDFNoOutlines:
+        return index_pages
+    except Exception as e:
+        print(f"⚠️ Could not read the PDF outline: {e}")
+        return index_pages
+    for _, title, dest, action, _ in outlines:
+        if not title or not any(word in str(title).lower() for word in INDEX_TITLES):
+            continue
+        try:
+            page_id = _outline_page_ref(dest, action, pdf.doc)
+        except Exception:
+            continue
+        if page_id in page_ids:
+            index_pages.add(page_ids[page_id])
+    return index_pages
+
+
+def classify_page(
+    page,
+    index_pages=frozenset(),
+    top_fraction=0.2,
+    min_table_chars=20,
+    min_drawing_strokes=50,
+    drawing_ratio=3,
+    header_fraction=0.3,
+    min_header_chars=10
+):
+    """
+    Sorts a page into index, table, drawing or blank before any layout analysis.
+
+    Only raw objects are looked at: the chars in the top band of the page (for
+    the "Inhaltsverzeichnis"/"index" title), the outline and simple object
+    counts. No words are built and the table finder is never run, so pages
+    that cannot hold a parts table cost almost nothing.
+
+    A page full of strokes is only a drawing when it shows no table header
+    (bold text in the header band): parts pages often carry an exploded
+    view next to their table, and those must still be extracted.
+
+    Args:
+        page: pdfplumber page object
+        index_pages: page numbers the outline marks as index (see outline_index_pages)
+        top_fraction: portion of the page height searched for an index title
+        min_table_chars: pages with fewer chars than this hold no parts table
+        min_drawing_strokes: curves/diagonal lines above which a page may be a drawing
+        drawing_ratio: how many times the table rules the strokes must outnumber,
+            so a table page with a logo or small sketch stays a table
+        header_fraction: portion of the page height holding the column headers
+        min_header_chars: bold chars in the header band that make a page a
+            table page whatever its drawing
+
+    Returns:
+        One of INDEX, TABLE, DRAWING or BLANK. BLANK covers every page with
+        nothing to extract: empty pages and text without any table rules.
+    """
+    if page.page_number - 1 in index_pages:
+        return INDEX
+
+    objects = page.objects
+    chars = objects.get("char", [])
+    band_bottom = page.height * top_fraction
+    top_text = "".join(c["text"] for c in chars if c["top"] < band_bottom)
+    if "Inhaltsverzeichnis" in top_text or "index" in top_text.lower():
+        return INDEX
+
+    rules = len(objects.get("rect", []))
+    strokes = len(objects.get("curve", []))
+    for line in objects.get("line", []):
+        # tables are drawn with horizontal and vertical rules only
+        if abs(line["x1"] - line["x0"]) < 1 or abs(line["bottom"] - line["top"]) < 1:
+            rules += 1
+        else:
+            strokes += 1
+
+    if strokes >= min_drawing_strokes and strokes > drawing_ratio * rules:
+        header_bottom = page.height * header_fraction
+        header_chars = sum(1 for c in chars if c["top"] < header_bottom and "Bold" in c.get("fontname", ""))
+        if header_chars < min_header_chars:
+            return DRAWING
+    if len(chars) < min_table_chars or rules == 0:
+        return BLANK
+    return TABLE
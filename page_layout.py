@@ -0,0 +1,146 @@
+import hashlib
+import numpy as np
+
+# Top portion of the page holding the column headers; only words in it are extracted
+HEADER_FRACTION = 0.3
+# Space kept above a known table top when cropping to the table region
+REGION_MARGIN = 10
+
+
+def _boxes(objects):
+    """Packs the (x0, top, x1, bottom) of pdfplumber objects into an (n, 4) float array."""
+    if not objects:
+        return np.empty((0, 4))
+    return np.array([(o["x0"], o["top"], o["x1"], o["bottom"]) for o in objects], dtype=float)
+
+
+class PageLayout:
+    """
+    Snapshot of one pdfplumber page's layout objects, parsed once.
+
+    The Sennebogen column detectors and table extraction all read from the
+    same snapshot instead of each asking pdfplumber to walk
+    the page again. Geometry is kept as (n, 4) arrays of x0, top, x1, bottom.
+
+    Words are only needed to read the column headers, so they are extracted
+    from a within_bbox crop of the header band (the top header_fraction of
+    the page) rather than from the whole page.
+
+    Attributes:
+        page: the underlying pdfplumber page (its parsed objects stay cached on it)
+        width, height: page size
+        header_bottom: bottom edge of the header band
+        words: words of the header band, extracted with use_text_flow and font attributes
+        word_text: list of word strings
+        word_boxes: word geometry
+        word_size: font size of each word
+        word_bold: whether each word is set in a bold font
+        rect_boxes: rect geometry
+        line_boxes: line geometry
+    """
+
+    def __init__(self, page, header_fraction=HEADER_FRACTION):
+        self.page = page
+        self.width = page.width
+        self.height = page.height
+        self.header_bottom = self.height * header_fraction
+
+        objects = page.objects
+
+        header = page.within_bbox((0, 0, self.width, self.header_bottom))
+        self.words = header.extract_words(keep_blank_chars=True, use_text_flow=True, extra_attrs=["fontname", "size"])
+        self.word_text = [w["text"] for w in self.words]
+        self.word_boxes = _boxes(self.words)
+        self.word_size = np.array([w.get("size", 0) for w in self.words], dtype=float)
+        self.word_bold = np.array(["Bold" in w.get("fontname", "") for w in self.words], dtype=bool)
+
+        self.rect_boxes = _boxes(objects.get("rect", []))
+        self.line_boxes = _boxes(objects.get("line", []))
+
+    def find_table(self, table_settings, region=None):
+        """
+        Runs pdfplumber's table finder, on the region (x0, top, x1, bottom)
+        only when one is given, and returns the largest table or None.
+        """
+        # pdfplumber caches the parsed objects on the page, so the table finder
+        # and the crops work from the same parse the snapshot was built from.
+        page = self.page.within_bbox(region) if region else self.page
+        return page.find_table(table_settings=table_settings)
+
+
+class TableRegions:
+    """
+    Where the parts table sits on pages of each layout, learned from the
+    first page of the layout that is extracted in full.
+
+    Later pages of the layout hand the table finder a within_bbox crop from
+    just above the table down to the bottom of the page, so titles, logos
+    and drawings above the table never reach it. Each region remembers the
+    header row found there; a cropped page whose table does not start with
+    the same header is extracted in full again (see extract_layout_table in
+    sennebogen).
+    """
+
+    def __init__(self, margin=REGION_MARGIN):
+        self.margin = margin
+        self.regions = {}  # (fingerprint, vertical lines) -> (table top, header row)
+
+    @staticmethod
+    def key(fingerprint, vertical_line):
+        return fingerprint, tuple(vertical_line)
+
+    def region_for(self, layout, fingerprint, vertical_line):
+        """The crop for the page as (bbox, expected header row), or None when the layout is not known yet."""
+        if fingerprint is None:
+            return None
+        known = self.regions.get(self.key(fingerprint, vertical_line))
+        if known is None:
+            return None
+        top, header = known
+        return (0, max(0, top - self.margin), layout.width, layout.height), header
+
+    def record(self, fingerprint, vertical_line, table_top, header):
+        """Stores the table top and header row found on a fully extracted page; the first page of a layout wins."""
+        if fingerprint is not None:
+            self.regions.setdefault(self.key(fingerprint, vertical_line), (table_top, header))
+
+
+def header_fingerprint(layout, header_fraction=HEADER_FRACTION, grid=5, min_rule_height=10):
+    """
+    Fingerprints everything the column detectors read from a page: where
+    the bold header words start (option 1), the geometry of the header rects
+    (option 2) and every vertical rule at least min_rule_height tall,
+    wherever it sits on the page (option 3, whose min_height it matches).
+    Positions are snapped to a grid so small jitter between pages of the
+    same layout does not change the result.
+
+    Returns None when the page has none of these features, since such pages
+    cannot be told apart.
+    """
+    header_bottom = layout.height * header_fraction
+    in_header = layout.word_boxes[:, 1] < header_bottom
+    bold = in_header & (layout.word_bold | (layout.word_size > 7.5))
+    word_xs = sorted(set(np.round(layout.word_boxes[bold, 0] / grid).astype(int).tolist()))
+    rects = layout.rect_boxes[layout.rect_boxes[:, 1] < header_bottom]
+    rect_xs = sorted(set(map(tuple, np.round(rects[:, [0, 2]] / grid).astype(int).tolist())))
+    lines = layout.line_boxes
+    vertical = (np.abs(lines[:, 2] - lines[:, 0]) < 1) & (np.abs(lines[:, 3] - lines[:, 1]) >= min_rule_height)
+    line_xs = sorted(set(np.round(lines[vertical, 0] / grid).astype(int).tolist()))
+    if not (word_xs or rect_xs or line_xs):
+        return None
+    key = f"{round(layout.width)}x{round(layout.height)}|{word_xs}|{rect_xs}|{line_xs}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def as_layout(page_or_layout, header_fraction=HEADER_FRACTION):
+    """
+    Returns a PageLayout for a pdfplumber page, or the layout itself if one
+    is passed. A caller reading words lower down than the layout's header
+    band (header_fraction of the page height) gets a layout whose band
+    reaches that far, so no header word is silently left out.
+    """
+    if isinstance(page_or_layout, PageLayout):
+        if page_or_layout.header_bottom >= page_or_layout.height * header_fraction:
+            return page_or_layout
+        return PageLayout(page_or_layout.page, header_fraction)
+    return PageLayout(page_or_layout, max(header_fraction, HEADER_FRACTION))
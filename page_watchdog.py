@@ -0,0 +1,258 @@
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from contextlib import closing
+from multiprocessing.connection import wait
+
+import pandas as pd
+import pdfplumber
+from tqdm import tqdm
+
+from file_utils import spool_to_temp_file
+
+# A page that takes longer than this (in seconds) is abandoned and its worker restarted
+PAGE_TIMEOUT = 120
+# Pages with more parsed objects (chars, lines, rects, curves, ...) than this are not extracted
+MAX_PAGE_OBJECTS = 200_000
+# Time a fresh worker gets to import its modules and open the PDF
+WORKER_START_TIMEOUT = 120
+
+REVIEW_SHEET = "Needs Review"
+REVIEW_COLUMNS = ["Page", "Reason"]
+
+DONE = "done"
+RESUMED = "resumed"
+FAILED = "failed"
+OVER_BUDGET = "over_budget"
+TIMED_OUT = "timed_out"
+_READY = "ready"
+
+
+class PageBudgetExceeded(Exception):
+    """Raised by page tasks for pages too large to extract within budget."""
+
+
+def check_object_budget(page, max_objects=MAX_PAGE_OBJECTS):
+    """Raises PageBudgetExceeded when the parsed page holds more than max_objects objects (None: no limit)."""
+    if max_objects is None:
+        return
+    count = sum(len(objects) for objects in page.objects.values())
+    if count > max_objects:
+        raise PageBudgetExceeded(f"{count} objects on the page (limit {max_objects})")
+
+
+def _serve_pages(conn, pdf_path, task_factory, task_args):
+    """
+    Worker loop: opens the PDF, builds the page task and extracts the pages
+    it is sent as (page number, context), one at a time, until it receives
+    None. The context, when not None, is passed to the task as a third
+    argument.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        task = task_factory(pdf, *task_args)
+        conn.send(_READY)
+        while True:
+            message = conn.recv()
+            if message is None:
+                return
+            page_number, context = message
+            page = pdf.pages[page_number]
+            try:
+                args = (page, page_number) if context is None else (page, page_number, context)
+                reply = (page_number, DONE, task(*args))
+            except PageBudgetExceeded as e:
+                reply = (page_number, OVER_BUDGET, str(e))
+            except Exception as e:
+                reply = (page_number, FAILED, str(e))
+            finally:
+                page.close()
+            conn.send(reply)
+
+
+class _Worker:
+    def __init__(self, context, pdf_path, task_factory, task_args):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_serve_pages, args=(child_conn, pdf_path, task_factory, task_args), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.page_number = None
+        self.deadline = time.monotonic() + WORKER_START_TIMEOUT
+
+    def submit(self, page_number, timeout, context=None):
+        self.conn.send((page_number, context))
+        self.page_number = page_number
+        self.deadline = time.monotonic() + timeout if timeout is not None else math.inf
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class PageWatchdog:
+    """
+    Runs pages in worker processes, each page under a time budget.
+
+    Every worker opens the PDF once and builds its page task by calling
+    task_factory(pdf, *task_args); both must be picklable (module-level).
+    task(page, page_number) returns the page's result, or raises
+    PageBudgetExceeded for pages it refuses (see check_object_budget). A
+    worker still busy with a page after timeout seconds is killed and
+    replaced, so one pathological page costs at most the timeout while the
+    rest of the document goes on. With timeout=None pages may take as long
+    as they need.
+    """
+
+    def __init__(self, pdf_path, task_factory, task_args=(), timeout=PAGE_TIMEOUT, workers=1):
+        self.pdf_path = pdf_path
+        self.task_factory = task_factory
+        self.task_args = tuple(task_args)
+        self.timeout = timeout
+        self.workers = max(1, workers)
+        # spawn keeps workers independent of the threads Streamlit runs us in
+        self.context = multiprocessing.get_context("spawn")
+
+    def _start_worker(self):
+        return _Worker(self.context, self.pdf_path, self.task_factory, self.task_args)
+
+    def run(self, page_numbers, context=None):
+        """
+        Yields (page_number, status, value) in page order: status DONE with the
+        task's result, or FAILED, OVER_BUDGET or TIMED_OUT with the reason.
+
+        context, if given, is called with each page number as the page is
+        handed to a worker, and its value is passed to the task along with
+        the page. It lets the caller share what it learned from earlier
+        results, which it sees as they are yielded.
+        """
+        queue = deque(page_numbers)
+        order = deque()
+        finished = {}
+        workers = [self._start_worker() for _ in range(min(self.workers, len(queue)))]
+        try:
+            while order or queue:
+                for worker in workers:
+                    if worker.ready and worker.page_number is None and queue:
+                        page_number = queue.popleft()
+                        order.append(page_number)
+                        worker.submit(page_number, self.timeout, context(page_number) if context else None)
+
+                deadlines = [
+                    worker.deadline for worker in workers
+                    if (not worker.ready or worker.page_number is not None) and worker.deadline != math.inf
+                ]
+                timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+                for conn in wait([worker.conn for worker in workers], timeout):
+                    i = next(i for i, worker in enumerate(workers) if worker.conn is conn)
+                    worker = workers[i]
+                    try:
+                        message = conn.recv()
+                    except EOFError:
+                        # the worker died (crash or out of memory) rather than raising
+                        if not worker.ready:
+                            raise RuntimeError(f"Page worker exited with code {worker.process.exitcode} while starting")
+                        if worker.page_number is not None:
+                            finished[worker.page_number] = (FAILED, "worker process exited")
+                        worker.kill()
+                        workers[i] = self._start_worker()
+                        continue
+                    if message == _READY:
+                        worker.ready = True
+                        continue
+                    page_number, status, value = message
+                    finished[page_number] = (status, value)
+                    worker.page_number = None
+
+                now = time.monotonic()
+                for i, worker in enumerate(workers):
+                    if now < worker.deadline or (worker.ready and worker.page_number is None):
+                        continue
+                    if not worker.ready:
+                        raise RuntimeError(f"Page worker did not start within {WORKER_START_TIMEOUT}s")
+                    print(f"⏱️ Page {worker.page_number + 1} took longer than {self.timeout}s; skipping it")
+                    finished[worker.page_number] = (TIMED_OUT, f"took longer than {self.timeout}s")
+                    worker.kill()
+                    workers[i] = self._start_worker()
+
+                while order and order[0] in finished:
+                    page_number = order.popleft()
+                    yield (page_number, *finished.pop(page_number))
+        finally:
+            for worker in workers:
+                worker.stop()
+
+
+def watch_document(
+    pdf_path,
+    task_factory,
+    task_args=(),
+    page_timeout=PAGE_TIMEOUT,
+    workers=1,
+    job=None,
+    review=None,
+    context=None
+):
+    """
+    Runs every page of a PDF under a PageWatchdog, yielding (page_number,
+    status, value) in page order.
+
+    Pages held by job (a PageCheckpoint) are not sent to the workers again
+    and come back as RESUMED with their stored rows. DONE pages carry the
+    task's result; saving it to the job is up to the caller, which knows its
+    shape. Pages that FAILED, went OVER_BUDGET or TIMED_OUT are appended to
+    review as (page_number, reason) and carry the reason. context is
+    passed on to PageWatchdog.run.
+    """
+    source, temp_path = spool_to_temp_file(pdf_path)
+    try:
+        with pdfplumber.open(source) as pdf:
+            page_count = len(pdf.pages)
+        stored = set()
+        if job:
+            # unreadable checkpoints load as None; those pages are extracted again
+            stored = {page_number for page_number in job.completed_pages() if job.load(page_number) is not None}
+        watchdog = PageWatchdog(source, task_factory, task_args, page_timeout, workers)
+        watched = watchdog.run(
+            (page_number for page_number in range(page_count) if page_number not in stored), context
+        )
+        with closing(watched), tqdm(total=page_count, desc="Processing Pages") as progress:
+            for page_number in range(page_count):
+                if page_number in stored:
+                    status, value = RESUMED, job.load(page_number)
+                else:
+                    _, status, value = next(watched)
+                    if status != DONE and review is not None:
+                        review.append((page_number, value))
+                progress.update()
+                yield page_number, status, value
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+def write_review_sheet(writer, review):
+    """
+    Lists the skipped pages, given as (page_number, reason) pairs, on the
+    console and on a "Needs Review" sheet of the output (Excel only; CSV and
+    Parquet hold a single table).
+    """
+    if not review:
+        return
+    print(f"🔎 {len(review)} page(s) need manual review: " + ", ".join(str(page + 1) for page, _ in review))
+    writer.add_sheet(REVIEW_SHEET, pd.DataFrame(
+        [(page_number + 1, reason) for page_number, reason in review], columns=REVIEW_COLUMNS
+    ))
@@ -4,7 +4,7 @@ import streamlit as st
 import pandas as pd
 import io
 # Make sure sortly_backend.py is in the main project folder
-from sortly_backend import run_update_process
+from job_panel import show_jobs, submit_job
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -43,7 +43,8 @@ This tool allows you to bulk update item prices in your Sortly inventory.
 1.  **Download the Example Format** to see the required Excel structure.
 2.  **Fill your Excel file** with the `Stock #` and new `Value` for each item.
 3.  **Drag and drop** your completed Excel file into the uploader below.
-4.  Click the **"Start Update Process"** button and monitor the live log.
+4.  Click the **"Start Update Process"** button and monitor the live log. The update runs in the
+    background, so you can refresh or leave the page and come back to it.
 """)
 
 # --- API Key Check ---
@@ -72,41 +73,16 @@ uploaded_file = st.file_uploader(
 )
 
 # --- Main Logic ---
+full_sync = st.checkbox(
+    "Rebuild the Sortly item map from scratch (only needed when items were deleted in Sortly; "
+    "otherwise only items changed since the last run are fetched)"
+)
 if uploaded_file is not None:
     if st.button("🚀 Start Update Process"):
-        st.session_state.log_messages = []
-        st.session_state.log_counter = 0
-
-        log_container = st.container()
-        log_container.write("--- Live Log ---")
-        log_placeholder = log_container.empty()
-
-        def streamlit_output_callback(message):
-            st.session_state.log_messages.append(str(message))
-
-            # Update text
-            log_placeholder.markdown(
-                f"""
-                <div style="height:400px; overflow-y:scroll; background-color:#1e1e1e; color:#FFD700;
-                            border:1px solid #FFCC00; border-radius:5px; padding:10px; font-family:monospace;" 
-                     id="log-box">
-                    {"<br>".join(st.session_state.log_messages)}
-                </div>
-                <script>
-                    var logBox = document.getElementById('log-box');
-                    logBox.scrollTop = logBox.scrollHeight;
-                </script>
-                """,
-                unsafe_allow_html=True
-            )
-
-            st.session_state.log_counter += 1
-
-        with st.spinner("Processing... This may take several minutes."):
-            run_update_process(
-                api_token=api_token,
-                uploaded_file=uploaded_file,
-                output_callback=streamlit_output_callback
-            )
+        submit_job(
+            "sortly", "sortly_update", {"full_sync": full_sync}, input_file=uploaded_file,
+            secrets={"api_token": api_token}
+        )
 
-        st.success("✅ Process Finished!")
\ No newline at end of file
+st.markdown("--- Live Log ---")
+show_jobs("sortly")
@@ -1,7 +1,60 @@
+import io
+import os
+import zipfile
+import pandas as pd
 import streamlit as st
-import sennebogen as sennebogen
-import qbo as qbo
-import liebherr as liebherr
+# the extractors themselves (pdfplumber, xhtml2pdf, ...) are only imported
+# by batch.convert_file when a conversion runs, so the page loads quickly
+import batch
+from table_output import MIME_TYPES, OUTPUT_FORMATS
+from profiling import StageProfiler
+from job_panel import show_jobs, submit_job
+
+
+def show_profile(profiler, name):
+    """Summary of a profiled conversion: time per stage, the slowest pages and the full JSON report."""
+    report = profiler.report()
+    st.write(f"⏱️ {report['pages']} pages profiled, {report['wall']:.1f}s in total")
+    if report["peak_rss_mb"] is not None:
+        st.write(f"🧠 Peak server memory: {report['peak_rss_mb']:.0f} MB")
+    st.dataframe(pd.DataFrame(report["stages"]))
+    st.dataframe(pd.DataFrame([
+        {"page": page["page"], "wall": page["wall"], "cpu": page["cpu"], **page["objects"]}
+        for page in report["slow_pages"]
+    ]))
+    st.download_button(
+        label="Download Slow-Page Report",
+        data=profiler.to_json(),
+        file_name=f"{name}.profile.json",
+        mime="application/json"
+    )
+
+
+def process_file(file, section, extractor, option, output_format, result_name, mime, workers=1):
+    """
+    Converts an uploaded file. With profiling switched on, the conversion
+    runs right here, uncached, and the report is shown; otherwise the
+    conversion is queued as a background job, which the section's job list
+    (show_jobs) follows until its download is ready.
+    """
+    if not st.session_state.get("profile_runs"):
+        submit_job(
+            section, "convert",
+            {"extractor": extractor, "option": option, "format": output_format, "workers": workers},
+            file, result_name, mime
+        )
+        return
+    with st.spinner("Processing..."):
+        profiler = StageProfiler()
+        data = batch.convert_file(file, extractor, option, output_format, workers=workers, profiler=profiler)
+        if hasattr(data, "read"):
+            # extractors return a (possibly disk-spooled) file object
+            data = data.read()
+    show_profile(profiler, file.name)
+    if data:
+        st.download_button(label=f"Download {result_name}", data=data, file_name=result_name, mime=mime)
+    else:
+        st.error("No tables found in the PDF.")
 
 
 dark_yellow_css = """
@@ -49,28 +102,49 @@ a, .css-1fv8s86, .css-1hxh2wk, .css-1ynw3xd {
 st.markdown(dark_yellow_css, unsafe_allow_html=True)
 
 st.title('File Conversions')
+st.checkbox(
+    "Profile conversions (shows time per stage and the slowest pages; skips the result cache)",
+    key="profile_runs"
+)
 st.subheader("Input in your Sennebogen file to turn into an Excel file.", divider="gray")
 st.write("Please look for the header format in the various files. Don't worry about header names just make sure the formats are similar.")
+workers = st.number_input(
+    "Worker processes (more workers finish large manuals faster)",
+    min_value=1,
+    max_value=os.cpu_count() or 1,
+    value=min(4, os.cpu_count() or 1),
+    key="senn_workers"
+)
+senn_format = st.selectbox(
+    "Output format (CSV and Parquet are faster to load into the ERP import)",
+    OUTPUT_FORMATS,
+    key="senn_format"
+)
+st.write("Not sure which option fits? Auto-detect tries all three on a few pages of each header layout and keeps the best one.")
+file = st.file_uploader("Input a PDF file", type=["PDF"], key="2auto")
+if st.button("Process File", key="2bauto"):
+    if file is not None:
+        process_file(
+            file, "2bauto", batch.SENNEBOGEN, batch.SENNEBOGEN_AUTO, senn_format, f"{file.name}.{senn_format}", MIME_TYPES[senn_format],
+            workers
+        )
+    else:
+        st.warning("Please upload a file before submitting.")
+show_jobs("2bauto")
+
 st.write("Option 1 if your file matches this format: ")
 st.write("Note: this table format has the headers left justified.")
 st.image("Option1.png", )
 file = st.file_uploader("Input a PDF file", type=["PDF"], key="2a")
 if st.button("Process File", key="2ba"):
     if file is not None:
-        with st.spinner("Processing..."):
-            excel_data = sennebogen.extract_tables_(file, 1)
-
-            if excel_data:
-                st.download_button(
-                    label="Download Excel File",
-                    data=excel_data,
-                    file_name=f"{file.name}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            else:
-                st.error("No tables found in the PDF.")
+        process_file(
+            file, "2ba", batch.SENNEBOGEN, 1, senn_format, f"{file.name}.{senn_format}", MIME_TYPES[senn_format],
+            workers
+        )
     else:
         st.warning("Please upload a file before submitting.")
+show_jobs("2ba")
 
 st.write("Option 2 if your file matches this format: ")
 st.write("Note: this table format has header names in rectangles and are middle justified.")
@@ -78,20 +152,13 @@ st.image("Option2.png", )
 file = st.file_uploader("Input a PDF file", type=["PDF"], key="2b")
 if st.button("Process File", key="2bb"):
     if file is not None:
-        with st.spinner("Processing..."):
-            excel_data = sennebogen.extract_tables_(file, 2)
-
-            if excel_data:
-                st.download_button(
-                    label="Download Excel File",
-                    data=excel_data,
-                    file_name=f"{file.name}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            else:
-                st.error("No tables found in the PDF.")
+        process_file(
+            file, "2bb", batch.SENNEBOGEN, 2, senn_format, f"{file.name}.{senn_format}", MIME_TYPES[senn_format],
+            workers
+        )
     else:
         st.warning("Please upload a file before submitting.")
+show_jobs("2bb")
 
 st.write("Option 3 if your file matches this format: ")
 st.write("Note: here the headers are also left justified, but there are lines deliniating the headers as well.")
@@ -99,55 +166,80 @@ st.image("Option3.png", )
 file = st.file_uploader("Input a PDF file", type=["PDF"], key="2c")
 if st.button("Process File", key="2bc"):
     if file is not None:
-        with st.spinner("Processing..."):
-            excel_data = sennebogen.extract_tables_(file, 3)
-
-            if excel_data:
-                st.download_button(
-                    label="Download Excel File",
-                    data=excel_data,
-                    file_name=f"{file.name}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            else:
-                st.error("No tables found in the PDF.")
+        process_file(
+            file, "2bc", batch.SENNEBOGEN, 3, senn_format, f"{file.name}.{senn_format}", MIME_TYPES[senn_format],
+            workers
+        )
     else:
         st.warning("Please upload a file before submitting.")
+show_jobs("2bc")
 
 st.subheader("Input in your QBO file to turn into a Receving Report file.", divider="gray")
 file = st.file_uploader("Input a PDF file", type=["PDF"], key="4")
 if st.button("Process File", key="4b"):
     if file is not None:
-        with st.spinner("Processing..."):
-            qbo_data = qbo.pdf_creation(file)
-            if qbo_data:
-                st.download_button(
-                    label="Download PDF File",
-                    data=qbo_data,
-                    file_name=f"{file.name}RecevingReport.pdf",
-                )
-            else:
-                st.error("No tables found in the PDF.")
+        process_file(
+            file, "4b", batch.QBO, None, None, f"{file.name}RecevingReport.pdf", "application/pdf"
+        )
     else:
         st.warning("Please upload a file before submitting.")
+show_jobs("4b")
 
 
 st.subheader("Input in your Liebherr file to turn into an Excel file.", divider="gray")
+liebherr_format = st.selectbox("Output format", OUTPUT_FORMATS, key="liebherr_format")
 file = st.file_uploader("Input a PDF file", type=["PDF"], key="3")
 
 if st.button("Process File", key="3b"):
     if file is not None:
-        with st.spinner("Processing..."):
-            excel_data = liebherr.extract_tables_(file)
-
-            if excel_data:
-                st.download_button(
-                    label="Download Excel File",
-                    data=excel_data,
-                    file_name=f"{file.name}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            else:
-                st.error("No tables found in the PDF.")
+        process_file(
+            file, "3b", batch.LIEBHERR, None, liebherr_format, f"{file.name}.{liebherr_format}", MIME_TYPES[liebherr_format]
+        )
     else:
         st.warning("Please upload a file before submitting.")
+show_jobs("3b")
+
+
+st.subheader("Convert many files at once into one ZIP.", divider="gray")
+st.write("Upload any mix of Sennebogen manuals, Liebherr manuals and QBO purchase orders, check the conversion picked for each file, and download all outputs together.")
+batch_files = st.file_uploader("Input PDF files", type=["PDF"], accept_multiple_files=True, key="batch")
+batch_format = st.selectbox("Output format for parts manuals", OUTPUT_FORMATS, key="batch_format")
+batch_workers = st.number_input(
+    "Files converted at the same time",
+    min_value=1,
+    max_value=os.cpu_count() or 1,
+    value=min(4, os.cpu_count() or 1),
+    key="batch_workers"
+)
+if batch_files:
+    conversions = st.data_editor(
+        pd.DataFrame({
+            "File": [f.name for f in batch_files],
+            "Conversion": [batch.guess_conversion(f.name) for f in batch_files],
+        }),
+        column_config={
+            "File": st.column_config.TextColumn(disabled=True),
+            "Conversion": st.column_config.SelectboxColumn(options=list(batch.CONVERSIONS), required=True),
+        },
+        hide_index=True,
+        key="batch_conversions"
+    )
+if st.button("Process Files", key="batchb"):
+    if batch_files:
+        # the uploads travel to the job as one ZIP, in upload order
+        upload = io.BytesIO()
+        with zipfile.ZipFile(upload, "w") as zf:
+            for i, f in enumerate(batch_files):
+                zf.writestr(str(i), f.getvalue())
+        submit_job(
+            "batchb", "batch",
+            {
+                "files": [[f.name, conversion] for f, conversion in zip(batch_files, conversions["Conversion"])],
+                "format": batch_format,
+                "workers": batch_workers,
+            },
+            upload, "conversions.zip", "application/zip"
+        )
+    else:
+        st.warning("Please upload files before submitting.")
+show_jobs("batchb")
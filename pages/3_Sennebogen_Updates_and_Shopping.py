@@ -1,5 +1,6 @@
 import streamlit as st
 import senn_web
+from job_panel import show_jobs, submit_job
 
 st.title("Sennebogen Item Update and Shopping for Items")
 st.markdown("""
@@ -27,40 +28,24 @@ st.subheader("Item Updates")
 file = st.file_uploader("Input an Excel file", type=["xlsx", "xls"], key="process")
 if st.button("Process File", key="process1"):
     if file is not None:
-        with st.spinner("Processing..."):
-            excel_data = senn_web.add_info(file, username, password)
-            if excel_data:
-                st.download_button(
-                    label="Download Excel File",
-                    data=excel_data,
-                    file_name=f"{file.name}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            else:
-                st.error("Wrong PDF format")
+        # credentials are handed to the job's process and wiped from the job table once it starts
+        submit_job(
+            "process1", "portal_info",
+            input_file=file,
+            result_name=f"{file.name}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            secrets={"username": username, "password": password}
+        )
     else:
         st.warning("Please upload a file before submitting.")
+show_jobs("process1")
 
 st.subheader("Add to Shopping Cart")
 file = st.file_uploader("Input an Excel file", type=["xlsx", "xls"], key="buy")
 
 if st.button("Process File", key="buy1"):
     if file is not None and username and password:
-        with st.spinner("Processing..."):
-            result = senn_web.add_to_cart(file, username, password)
-            
-            if result:
-                st.success("Processing completed!")
-                
-                # Display results
-                for item, status in result.items():
-                    if "not found" in status.lower():
-                        st.error(f"Item {item}: {status}")
-                    elif "not enough stock" in status.lower():
-                        st.warning(f"Item {item}: {status}")
-                    else:
-                        st.warning(f"Item {item}: {status}")
-            else:
-                st.error("Failed to process the file.")
+        submit_job("buy1", "portal_cart", input_file=file, secrets={"username": username, "password": password})
     else:
-        st.warning("Please upload a file and enter username/password before submitting.")
\ No newline at end of file
+        st.warning("Please upload a file and enter username/password before submitting.")
+show_jobs("buy1")
\ No newline at end of file
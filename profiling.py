@@ -0,0 +1,134 @@
+import json
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# page number used for work that belongs to the whole document (merging, writing)
+DOCUMENT = -1
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children, in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def print_peak_memory():
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"🧠 Peak memory: {peak:.0f} MB")
+
+
+class StageProfiler:
+    """
+    Records wall and CPU time per page and stage, plus object counts per page.
+
+    Extractors take an optional profiler and wrap their stages in
+    profiler.stage(page_number, name); work done once per document is
+    recorded under page DOCUMENT. Profiles from worker processes are plain
+    dicts (export()) that the parent merge()s.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        # page -> stage -> [wall seconds, cpu seconds]
+        self.times = defaultdict(lambda: defaultdict(lambda: [0.0, 0.0]))
+        self.counts = defaultdict(dict)
+
+    @contextmanager
+    def stage(self, page_number, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            totals = self.times[page_number][name]
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.process_time() - cpu
+
+    def count(self, page_number, **counts):
+        self.counts[page_number].update(counts)
+
+    def export(self):
+        return {
+            "times": {page: {name: list(t) for name, t in stages.items()} for page, stages in self.times.items()},
+            "counts": {page: dict(counts) for page, counts in self.counts.items()},
+        }
+
+    def merge(self, exported):
+        for page, stages in exported["times"].items():
+            for name, (wall, cpu) in stages.items():
+                totals = self.times[int(page)][name]
+                totals[0] += wall
+                totals[1] += cpu
+        for page, counts in exported["counts"].items():
+            self.counts[int(page)].update(counts)
+
+    def stage_totals(self):
+        """Wall and CPU seconds per stage over all pages, slowest stage first."""
+        totals = defaultdict(lambda: [0.0, 0.0])
+        for stages in self.times.values():
+            for name, (wall, cpu) in stages.items():
+                totals[name][0] += wall
+                totals[name][1] += cpu
+        return [
+            {"stage": name, "wall": wall, "cpu": cpu}
+            for name, (wall, cpu) in sorted(totals.items(), key=lambda item: -item[1][0])
+        ]
+
+    def slow_pages(self, top=20):
+        """The top pages by total wall time, with their per-stage times and object counts."""
+        pages = []
+        for page, stages in self.times.items():
+            if page == DOCUMENT:
+                continue
+            pages.append({
+                "page": page + 1,
+                "wall": sum(wall for wall, _ in stages.values()),
+                "cpu": sum(cpu for _, cpu in stages.values()),
+                "stages": {name: round(wall, 4) for name, (wall, _) in stages.items()},
+                "objects": self.counts.get(page, {}),
+            })
+        pages.sort(key=lambda page: -page["wall"])
+        return pages[:top]
+
+    def report(self, top=20):
+        page_count = sum(1 for page in self.times if page != DOCUMENT)
+        return {
+            "pages": page_count,
+            "wall": sum(total["wall"] for total in self.stage_totals()),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stage_totals(),
+            "slow_pages": self.slow_pages(top),
+        }
+
+    def to_json(self, top=20):
+        return json.dumps(self.report(top), indent=2)
+
+    def write_json(self, path, top=20):
+        with open(path, "w") as f:
+            f.write(self.to_json(top))
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off; every hook is a no-op."""
+
+    enabled = False
+
+    def stage(self, page_number, name):
+        return nullcontext()
+
+    def count(self, page_number, **counts):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -2,9 +2,17 @@ import pdfplumber
 import pandas as pd
 import io
 import re
+from profiling import DOCUMENT, NULL_PROFILER
 
 
-def extract_values(pdf_path):
+def extract_values(pdf_path, profiler=None):
+    """
+    Reads the line items, shipping block and totals of a QBO purchase order.
+
+    profiler (a profiling.StageProfiler) optionally records per-page stage
+    times and object counts.
+    """
+    profiler = profiler or NULL_PROFILER
     combinded_data = []
     subtotal = None
     total = None
@@ -13,7 +21,10 @@ def extract_values(pdf_path):
     with pdfplumber.open(pdf_path) as pdf:
         i = 0
         for page in pdf.pages:
-            text = page.extract_text()
+            with profiler.stage(i, "extract_text"):
+                text = page.extract_text()
+            if profiler.enabled:
+                profiler.count(i, chars=len(page.chars), rects=len(page.rects), lines=len(page.lines))
             subtotal_match = re.search(r"SUBTOTAL\s+([\d,]+\.\d{2})", text)
             if subtotal_match:
                 subtotal = subtotal_match.group(1)
@@ -22,41 +33,42 @@ def extract_values(pdf_path):
                 currency = total_match.group(1) 
                 total = total_match.group(2)
 
-            if i == 0:
-                height = page.height
-                width = page.width
-                cropped_page_1 = page.within_bbox((0, 2 * height / 5, width, height))
-                tables = cropped_page_1.extract_table(table_settings={
-                    "horizontal_strategy": "text",
-                    "explicit_vertical_lines": [67, 225, 270, 340, 545],
-                    "snap_tolerance": 9,
-                    "vertical_strategy": "explicit"
-                })
-
-                # debug_pic= cropped_page_1.to_image()
-                # debug_pic.debug_tablefinder(table_settings={
-                #     "horizontal_strategy": "text",
-                #     "explicit_vertical_lines": [67, 225, 270, 340, 545],
-                #     "vertical_strategy": "explicit",
-                #     "snap_tolerance": 8
-                # })
-                # debug_pic.save(f"output_tables/{i}.png")
-
-                cropped_page_2 = page.within_bbox((0, height/5, width, 4*height/9))
-                shipping_info = cropped_page_2.extract_table(table_settings={
-                    "horizontal_strategy": "text",
-                    "explicit_vertical_lines": [60, 210, 400, 520],
-                    "vertical_strategy": "explicit",
-                    "snap_tolerance": 8
-
-                })
-            else:
-                tables = page.extract_table(table_settings={
-                    "horizontal_strategy": "text",
-                    "explicit_vertical_lines": [67, 225, 270, 340, 545],
-                    "snap_tolerance": 10,
-                    "vertical_strategy": "explicit"
-                })
+            with profiler.stage(i, "extract_table"):
+                if i == 0:
+                    height = page.height
+                    width = page.width
+                    cropped_page_1 = page.within_bbox((0, 2 * height / 5, width, height))
+                    tables = cropped_page_1.extract_table(table_settings={
+                        "horizontal_strategy": "text",
+                        "explicit_vertical_lines": [67, 225, 270, 340, 545],
+                        "snap_tolerance": 9,
+                        "vertical_strategy": "explicit"
+                    })
+
+                    # debug_pic= cropped_page_1.to_image()
+                    # debug_pic.debug_tablefinder(table_settings={
+                    #     "horizontal_strategy": "text",
+                    #     "explicit_vertical_lines": [67, 225, 270, 340, 545],
+                    #     "vertical_strategy": "explicit",
+                    #     "snap_tolerance": 8
+                    # })
+                    # debug_pic.save(f"output_tables/{i}.png")
+
+                    cropped_page_2 = page.within_bbox((0, height/5, width, 4*height/9))
+                    shipping_info = cropped_page_2.extract_table(table_settings={
+                        "horizontal_strategy": "text",
+                        "explicit_vertical_lines": [60, 210, 400, 520],
+                        "vertical_strategy": "explicit",
+                        "snap_tolerance": 8
+
+                    })
+                else:
+                    tables = page.extract_table(table_settings={
+                        "horizontal_strategy": "text",
+                        "explicit_vertical_lines": [67, 225, 270, 340, 545],
+                        "snap_tolerance": 10,
+                        "vertical_strategy": "explicit"
+                    })
             i += 1
             if tables:
                 df = pd.DataFrame(tables[1:], columns=tables[0])
@@ -97,18 +109,23 @@ def extract_values(pdf_path):
     return data
     # pdf portion
 
-from xhtml2pdf import pisa
-from io import BytesIO
-from jinja2 import Template
+# Bump when the extraction or receiving_report.html changes, so cached reports are rebuilt
+REPORT_VERSION = 1
+
+def pdf_creation(path, profiler=None):
+    # xhtml2pdf pulls in reportlab and friends; only load them when a report is built
+    from xhtml2pdf import pisa
+    from jinja2 import Template
 
-def pdf_creation(path):
-    data = extract_values(path)
+    profiler = profiler or NULL_PROFILER
+    data = extract_values(path, profiler)
     with open("receiving_report.html", "r") as f:
         html_template = f.read()
 
-    html_content = Template(html_template).render(data)
-    buffer = BytesIO()
-    pisa.CreatePDF(html_content, dest=buffer)
+    with profiler.stage(DOCUMENT, "render"):
+        html_content = Template(html_template).render(data)
+        buffer = io.BytesIO()
+        pisa.CreatePDF(html_content, dest=buffer)
     buffer.seek(0)
     return buffer.getvalue()
 
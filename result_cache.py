@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+from file_utils import file_sha256
+
+RESULT_CACHE_DIR = "conversion_cache"
+MAX_CACHE_BYTES = 1024 ** 3
+# Seconds between checks while another process converts the same file
+LOCK_POLL_INTERVAL = 0.5
+# The converting process refreshes its lock file this often; a lock left
+# untouched for LOCK_STALE_SECONDS belongs to a crashed process and is broken
+LOCK_HEARTBEAT = 10
+LOCK_STALE_SECONDS = 60
+
+
+class Uncached:
+    """
+    A compute() result that is returned but not stored, such as the output
+    of a conversion that had to skip pages: a rerun may well get them.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+
+def cache_key(doc_hash, extractor, version, settings=()):
+    """Key of a conversion result: input bytes, extractor, its code version and the options used."""
+    payload = json.dumps([doc_hash, extractor, version, [str(setting) for setting in settings]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Disk-backed store of finished conversions, one file per result.
+
+    A hit touches the file's modification time, so the oldest files are the
+    least recently used ones and are evicted first once the store grows past
+    max_bytes.
+
+    Concurrent requests for the same key within the process (Streamlit runs
+    every session as a thread of one server process) are single-flighted:
+    the first one computes, the others wait for and share its result, or its
+    exception, instead of converting the same file again. Across processes
+    (background jobs each run in their own) the computing one holds a
+    <key>.lock file; the others poll until its result is stored, and take
+    over if it fails or crashes.
+    """
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.bin")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used results until the store fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".bin"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                continue
+            total -= size
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached bytes for key, running compute() on a miss.
+
+        compute may return bytes, a file-like object (e.g. a BytesIO) or None;
+        its result is stored and returned as bytes (None as b""). Wrapped in
+        Uncached, it is returned without being stored.
+        """
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = Future()
+        if not leader:
+            return flight.result()
+
+        try:
+            data = self._compute_locked(key, compute)
+            flight.set_result(data)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return data
+
+    def _acquire_file_lock(self, key, lock_path):
+        """Takes the cross-process lock for key; returns the cached bytes instead if they appear meanwhile."""
+        os.makedirs(self.root, exist_ok=True)
+        waiting = False
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return None
+            except FileExistsError:
+                pass
+            data = self.get(key)
+            if data is not None:
+                return data
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if not waiting:
+                print("⏳ The same file is being converted by another job; waiting for its result...")
+                waiting = True
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def _compute_locked(self, key, compute):
+        lock_path = os.path.join(self.root, f"{key}.lock")
+        data = self._acquire_file_lock(key, lock_path)
+        if data is not None:
+            return data
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(LOCK_HEARTBEAT):
+                try:
+                    os.utime(lock_path)
+                except OSError:
+                    pass
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            # another process may have stored the result just before we took the lock
+            data = self.get(key)
+            if data is None:
+                data = compute()
+                store = not isinstance(data, Uncached)
+                if not store:
+                    data = data.data
+                if hasattr(data, "read"):
+                    data.seek(0)
+                    data = data.read()
+                elif data is None:
+                    data = b""
+                try:
+                    if store:
+                        self.put(key, data)
+                except OSError as e:
+                    print(f"⚠️ Could not store conversion result in cache: {e}")
+            return data
+        finally:
+            stop.set()
+            beat.join()
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """The process-wide cache, shared by every session so single-flight works across them."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
+
+
+def cached_conversion(pdf_file, extractor, version, settings, compute, cache=None):
+    """
+    Runs a conversion through the result cache.
+
+    Args:
+        pdf_file: path or file-like object of the input PDF (hashed with SHA-256)
+        extractor: name of the conversion, e.g. "sennebogen"
+        version: the extractor's code version; bumping it invalidates old results
+        settings: options that change the output (detector option, format, ...)
+        compute: callable doing the conversion when there is no cached result
+        cache: ResultCache to use; defaults to default_cache()
+
+    Returns:
+        The converted file as bytes (empty when the conversion produced nothing).
+    """
+    cache = cache or default_cache()
+    key = cache_key(file_sha256(pdf_file), extractor, version, settings)
+    return cache.get_or_compute(key, compute)
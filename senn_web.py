@@ -1,21 +1,38 @@
-from playwright.sync_api import sync_playwright
-import pandas as pd
 import subprocess
 import os
+import glob
+import threading
 from io import BytesIO
 
+PLAYWRIGHT_BROWSERS = os.path.expanduser("~/.cache/ms-playwright")
+
+_browser_lock = threading.Lock()
+_browser_checked = False
+
 def ensure_playwright_browser_installed():
-    chromium_dir = os.path.expanduser("~/.cache/ms-playwright/chromium-1124")
-    if not os.path.exists(chromium_dir):
-        try:
-            subprocess.run(["playwright", "install", "chromium"], check=True)
-        except Exception as e:
-            print("Error installing Chromium:", e)
+    """
+    Installs Playwright's Chromium if it is missing. The check runs once per
+    process, on first use, instead of on import.
+    """
+    global _browser_checked
+    with _browser_lock:
+        if _browser_checked:
+            return
+        if not glob.glob(os.path.join(PLAYWRIGHT_BROWSERS, "chromium-*")):
+            try:
+                subprocess.run(["playwright", "install", "chromium"], check=True)
+            except Exception as e:
+                print("Error installing Chromium:", e)
+        _browser_checked = True
 
-ensure_playwright_browser_installed()
+def browser_session():
+    """Starts Playwright (imported on first use) after making sure its browser is installed."""
+    from playwright.sync_api import sync_playwright
+    ensure_playwright_browser_installed()
+    return sync_playwright()
 
 def check_cred(user, pswd):
-    with sync_playwright() as p:
+    with browser_session() as p:
         browser = p.chromium.launch(headless=True)  # Set to True for deployment
         page = browser.new_page()
         try:
@@ -44,6 +61,7 @@ def highlight_not_found(row):
         return ['background-color: yellow'] * len(row)
     return [''] * len(row)
 def add_info(file, username, password):
+    import pandas as pd
     df = pd.read_excel(file)
     df['Status'] = ''
     df['SKU'] = ''
@@ -54,7 +72,7 @@ def add_info(file, username, password):
     df['Height'] = ''
     df['Width'] = ''
     df['Length'] = ''
-    with sync_playwright() as p:
+    with browser_session() as p:
         browser = p.chromium.launch(headless=True)  # Set to True for deployment
         page = browser.new_page()
         try:
@@ -97,7 +115,8 @@ def add_info(file, username, password):
     return output_stream
 # add things to a shopping cart
 def add_to_cart(file, username, password):
-    with sync_playwright() as p:
+    import pandas as pd
+    with browser_session() as p:
         browser = p.chromium.launch(headless=True)  # Set to True for deployment
         page = browser.new_page()
         output = {}
@@ -1,45 +1,50 @@
 import pdfplumber
 import pandas as pd
+import numpy as np
+import multiprocessing
+import os
 from tqdm import tqdm
-from io import BytesIO
-from openpyxl.styles import Alignment, Font, Border, Side
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from page_layout import PageLayout, TableRegions, as_layout, header_fingerprint
+from clustering import cluster_centers, filter_min_gap, merge_boxes, unique_rounded
+from template_cache import TEMPLATE_CACHE_FILE, ColumnTemplateCache
+from page_classifier import TABLE, classify_page, outline_index_pages
+from checkpoint import CHECKPOINT_DIR, PageCheckpoint, open_job
+from profiling import DOCUMENT, NULL_PROFILER, StageProfiler, print_peak_memory
+from page_watchdog import (
+    DONE, MAX_PAGE_OBJECTS, PAGE_TIMEOUT, RESUMED, check_object_budget, watch_document, write_review_sheet
+)
+from file_utils import spool_to_temp_file
+from table_output import XLSX, open_table_writer
+from typing import NamedTuple
 from collections import defaultdict
-from statistics import mean, median
 
 
 def find_vertical_lines_option1(page, header_fraction=0.25, x_tolerance=20, min_headers=3):
     """
     Infers vertical column boundaries based on the left edge (x0) of bold header text
     and includes the final right boundary (max x1).
+
+    page may be a pdfplumber page or a PageLayout snapshot of one; a snapshot
+    whose header band ends above header_fraction is extended to it.
     """
-    words = page.extract_words(keep_blank_chars=True, use_text_flow=True, extra_attrs=["fontname", "size"])
-    header_top = page.height * header_fraction
-    header_words = [w for w in words if w['top'] < header_top]
+    layout = as_layout(page, header_fraction)
+    header_top = layout.height * header_fraction
+    in_header = layout.word_boxes[:, 1] < header_top
 
     # Detect bold or large words
-    bold_words = [
-        w for w in header_words
-        if ('Bold' in w.get('fontname', '') or w.get('size', 0) > 7.5)
-    ]
+    is_bold = in_header & (layout.word_bold | (layout.word_size > 7.5))
+    bold_boxes = layout.word_boxes[is_bold]
 
-    if len(bold_words) < min_headers:
+    if len(bold_boxes) < min_headers:
         # Fallback to old logic or return safe defaults
-        return [0, 560, round(page.width)]
+        return [0, 560, round(layout.width)]
 
     # Use x0 of bold words as column starts
-    starts = [round(w["x0"]) for w in bold_words]
-    ends = [round(w["x1"]) for w in bold_words]
-    starts.sort()
+    starts = np.round(bold_boxes[:, 0])
 
     # Cluster close x0s
-    clusters = [[starts[0]]]
-    for x in starts[1:]:
-        if abs(x - clusters[-1][-1]) <= x_tolerance:
-            clusters[-1].append(x)
-        else:
-            clusters.append([x])
-    left_edges = [round(mean(c)) for c in clusters]
+    left_edges = cluster_centers(starts, x_tolerance)
 
     # Add final column end (rightmost x1)
     right_most = 560
@@ -49,20 +54,11 @@ def find_vertical_lines_option1(page, header_fraction=0.25, x_tolerance=20, min_
     verticals = sorted(set(verticals))
     if 0 not in verticals:
         verticals.insert(0, 0)
-    if round(page.width) not in verticals:
-        verticals.append(round(page.width))
+    if round(layout.width) not in verticals:
+        verticals.append(round(layout.width))
 
     # Remove near-duplicates
-    filtered = [verticals[0]]
-    for x in verticals[1:]:
-        if x - filtered[-1] > 15:
-            filtered.append(x)
-
-    return filtered
-
-import pdfplumber
-from statistics import mean
-
+    return filter_min_gap(verticals, 15)
 
 def find_vertical_lines_option2(
     page,
@@ -77,7 +73,7 @@ def find_vertical_lines_option2(
     and filtering out close duplicates using x_tolerance.
 
     Args:
-        page: pdfplumber page object
+        page: pdfplumber page object or PageLayout snapshot
         header_fraction: float, portion of page height to treat as header
         cluster_tol: int, clustering tolerance for x positions
         box_merge_tol: int, tolerance for merging boxes with similar x0/x1
@@ -87,259 +83,824 @@ def find_vertical_lines_option2(
     Returns:
         List of unique, sorted vertical column boundary x-positions.
     """
-    header_bottom = page.height * header_fraction
-    rects = [r for r in page.rects if r["top"] < header_bottom]
+    layout = as_layout(page)
+    header_bottom = layout.height * header_fraction
+    rects = layout.rect_boxes[layout.rect_boxes[:, 1] < header_bottom]
 
-    if not rects:
+    if not len(rects):
         return []
 
     # Group similar boxes together
-    merged_boxes = []
-    used = [False] * len(rects)
-
-    for i, r1 in enumerate(rects):
-        if used[i]:
-            continue
-        group = [r1]
-        for j, r2 in enumerate(rects[i + 1:], start=i + 1):
-            if used[j]:
-                continue
-            same_col = (
-                abs(r1["x0"] - r2["x0"]) <= box_merge_tol and
-                abs(r1["x1"] - r2["x1"]) <= box_merge_tol
-            )
-            stacked = (
-                abs(r1["top"] - r2["top"]) <= vertical_merge_tol or
-                abs(r1["bottom"] - r2["bottom"]) <= vertical_merge_tol
-            )
-            if same_col and stacked:
-                group.append(r2)
-                used[j] = True
-        used[i] = True
-        x0s = [r["x0"] for r in group]
-        x1s = [r["x1"] for r in group]
-        merged_boxes.append((round(mean(x0s)), round(mean(x1s))))
+    groups = merge_boxes(rects, box_merge_tol, vertical_merge_tol)
+    merged_x0 = np.round([rects[g, 0].mean() for g in groups])
+    merged_x1 = np.round([rects[g, 2].mean() for g in groups])
 
     # Extract all x0 and x1 values, then cluster
-    xs = sorted(set([x for box in merged_boxes for x in box]))
-    clustered = [[xs[0]]]
-    for x in xs[1:]:
-        if abs(x - clustered[-1][-1]) <= cluster_tol:
-            clustered[-1].append(x)
-        else:
-            clustered.append([x])
-    verticals = [round(mean(c)) for c in clustered]
+    xs = np.unique(np.concatenate([merged_x0, merged_x1]))
+    verticals = cluster_centers(xs, cluster_tol)
 
     # Final filtering using x_tolerance (optional cleanup for near-duplicates)
-    filtered = [verticals[0]]
-    for x in verticals[1:]:
-        if x - filtered[-1] > x_tolerance:
-            filtered.append(x)
-
-    return filtered
+    return filter_min_gap(verticals, x_tolerance)
 
 def find_vertical_lines_option3(page, min_height=10, tolerance=2):
-    x_positions = []
-
-    for line in page.lines:
-        x0, x1 = round(line["x0"]), round(line["x1"])
-        y0, y1 = line["y0"], line["y1"]
-        height = abs(y1 - y0)
+    layout = as_layout(page)
+    lines = layout.line_boxes
+    x0, x1 = np.round(lines[:, 0]), np.round(lines[:, 2])
+    height = np.abs(lines[:, 3] - lines[:, 1])
 
-        # Only consider vertical lines of sufficient height
-        if abs(x0 - x1) < 1 and height >= min_height:
-            x_positions.append(x0)
+    # Only consider vertical lines of sufficient height
+    x_positions = x0[(np.abs(x0 - x1) < 1) & (height >= min_height)].astype(int)
 
     # Remove near-duplicates by clustering
-    x_positions = sorted(set(x_positions))
-    clustered = []
-    for x in x_positions:
-        if not clustered or abs(x - clustered[-1]) > tolerance:
-            clustered.append(x)
-
-    return clustered
-
-def flatten_rows(data, add_col=False):
-    processed = []
-    previous_row = None
-
-    for row in data:
-        if "Pos" in str(row[0]).strip():
-            continue
-
-        if not add_col and not str(row[0]).strip().isdigit():
-            if previous_row:
-                for col_index in range(1, len(row)):
-                    if previous_row[col_index] is None:
-                        previous_row[col_index] = ""
-                    if row[col_index]:
-                        previous_row[col_index] += f" {row[col_index]}".strip()
-            else:
-                print(f"Warning: overflow row without a previous one: {row}")
+    return filter_min_gap(x_positions, tolerance)
+
+def get_horizontal_lines_from_rects(page, tolerance=1):
+    layout = as_layout(page)
+    y0 = np.round(layout.rect_boxes[:, 1], 1)
+    y1 = np.round(layout.rect_boxes[:, 3], 1)
+
+    # Treat very short height as horizontal "line" — flat rectangle
+    flat = np.abs(y1 - y0) <= tolerance
+
+    # Remove duplicates with tolerance
+    return unique_rounded(y0[flat], 1)
+
+
+STANDARD_COLUMNS = ["Fig./\nPos.", "No./\nIdent.", "Nomenclature", "Benennung", "Qty./\nMenge.", "Qty. Unit/", "MPOS~Remark/Bemerkung", "see page\n s. Seite"]
+HEADER_MAP = {
+    "Pos./\nFig.": "Fig./\nPos.",
+    "Ident./\nNo.": "No./\nIdent.",
+    "Menge\nQty.": "Qty./\nMenge.",
+    "MPOS~Bemerkung/Remark" : "MPOS~Remark/Bemerkung",
+    "s Seite\nsee page":"see page\n s. Seite",
+    "Item no." : "Fig./\nPos",
+    "SeboNr": "No./\nIdent.",
+    "Fig./\nPos": "Fig./\nPos.",
+    "Description" : "Nomenclature",
+    "Quantity" : "Qty./\nMenge.",
+    "Comment" : "MPOS~Remark/Bemerkung",
+    "Ident.\nNo.": "No./\nIdent.",
+    "Bemerkung\nRemark" : "MPOS~Remark/Bemerkung",
+    "Remark/\nBemerkung" : "MPOS~Remark/Bemerkung",
+    "Menge/\nQty.": "Qty./\nMenge.",
+    "Item\nno." : "Fig./\nPos",
+    "Quanti\nty" : "Qty./\nMenge.",
+    "Unit" : "Qty. Unit/",
+    "ME/\nQty. Unit" : "Qty. Unit/",
+    "siehe S.\nsee page" : "see page\n s. Seite",
+    "Qty. Unit/ \nQty. Unit" : "Qty. Unit/",
+    "No./\nLevel": "No./\nIdent.",
+    "see page\ns. Seite": "see page\n s. Seite",
+    "Qty./\nMenge": "Qty./\nMenge.",
+    "Iden\nNo" : "No./\nIdent.",
+    "MPOS~Bemerkung/\nRemark": "MPOS~Remark/Bemerkung",
+    "s. Seite\nsee page": "see page\n s. Seite",
+    "Level/\nNo.": "No./\nIdent."
+
+}
+
+# Raw rows carry the page's own first column (normally the position number)
+# after the standard columns; continuation rows are recognised by it.
+POS_KEY = "_pos"
+RAW_COLUMNS = STANDARD_COLUMNS + [POS_KEY]
+# typed columns in CSV/Parquet output
+QUANTITY_COLUMN = "Qty./\nMenge."
+UNIT_COLUMN = "Qty. Unit/"
+
+
+def align_table_rows(header, raw_rows):
+    """
+    Maps a page table onto RAW_COLUMNS: headers are normalized through
+    HEADER_MAP, standard columns missing from the page are filled with ""
+    and the page's first cell is kept as the POS_KEY column.
+    """
+    mapped = [HEADER_MAP.get(col, col) for col in header]
+    for col in mapped:
+        if col not in HEADER_MAP and col not in STANDARD_COLUMNS:
+            print(f"⚠️ Unmapped column: {repr(col)}")
+    positions = [mapped.index(col) if col in mapped else None for col in STANDARD_COLUMNS]
+    return [
+        [row[i] if i is not None else "" for i in positions] + [row[0]]
+        for row in raw_rows
+    ]
+
+
+def merge_continuation_rows(raw):
+    """
+    Folds overflow lines into the part row they continue, across the whole document.
+
+    raw is a DataFrame with RAW_COLUMNS. Header rows repeated inside a table
+    ("Pos" in the first cell) are dropped. Every row whose first cell is a
+    number starts a part, so a running count of those rows is the group key;
+    the text of the following non-numeric rows is joined onto the part with
+    a space, including when the overflow continues on the next page.
+
+    Returns a DataFrame with STANDARD_COLUMNS.
+    """
+    key = raw[POS_KEY].astype(str).str.strip()
+    raw = raw[~key.str.contains("Pos", regex=False)]
+    key = key[raw.index]
+    starts = key.str.isdigit()
+    group = starts.cumsum()
+
+    orphans = group == 0
+    if orphans.any():
+        print(f"Warning: {int(orphans.sum())} overflow row(s) without a previous one were dropped")
+        raw, starts, group = raw[~orphans], starts[~orphans], group[~orphans]
+
+    merged = raw.loc[starts, STANDARD_COLUMNS].set_axis(group[starts].values)
+    sizes = group.map(group.value_counts())
+    multi = sizes > 1
+    if multi.any():
+        continued = raw[multi]
+        is_start = starts[multi]
+        # the position itself is never extended by its overflow rows
+        for col in STANDARD_COLUMNS[1:]:
+            values = continued[col].fillna("").astype(str)
+            values = values.where(is_start, values.str.strip())
+            values = values.where(is_start | (values == ""), " " + values)
+            joined = values.groupby(group[multi]).sum().str.strip()
+            merged.loc[joined.index, col] = joined
+    return merged.reset_index(drop=True)
+
+
+def _starts_part(key):
+    return str(key).strip().isdigit()
+
+
+class ContinuationMerger:
+    """
+    Runs merge_continuation_rows on a document that arrives page by page.
+
+    Raw rows are collected until there are batch_rows of them; then
+    everything before the last part start is merged and handed out. The
+    last part is held back, since the next page may still continue it.
+    Merging in batches rather than per page keeps pandas' per-call overhead
+    out of the page loop while memory stays bounded by the batch size: a
+    part whose overflow alone fills a batch is folded into a single row.
+    """
+
+    def __init__(self, batch_rows=5000):
+        self.batch_rows = batch_rows
+        self.pending = []
+
+    def feed(self, rows):
+        """Takes raw rows (RAW_COLUMNS) and returns the parts completed so far once a batch is full, or None."""
+        self.pending.extend(rows)
+        if len(self.pending) < self.batch_rows:
+            return None
+        last_start = next(
+            (i for i in range(len(self.pending) - 1, -1, -1) if _starts_part(self.pending[i][-1])),
+            None
+        )
+        if not last_start:
+            # one open part (or overflow without a part) fills the batch
+            merged = merge_continuation_rows(pd.DataFrame(self.pending, columns=RAW_COLUMNS))
+            key = self.pending[0][-1]
+            self.pending = [merged.iloc[0].tolist() + [key]] if len(merged) else []
+            return None
+        complete, self.pending = self.pending[:last_start], self.pending[last_start:]
+        return merge_continuation_rows(pd.DataFrame(complete, columns=RAW_COLUMNS))
+
+    def finish(self):
+        """Merges the rows still held back at the end of the document."""
+        complete, self.pending = self.pending, []
+        if not complete:
+            return None
+        return merge_continuation_rows(pd.DataFrame(complete, columns=RAW_COLUMNS))
+
+
+# Bump when a change alters the extracted rows, so checkpoints of older runs are not resumed
+EXTRACTOR_VERSION = 1
+
+# Pages handed to each worker at a time; several shards per worker keep the
+# pool busy when some parts of a manual (e.g. drawings) are cheaper than others.
+SHARDS_PER_WORKER = 4
+
+
+# option value that lets extract_tables_ pick the detector per layout
+AUTO = "auto"
+
+DETECTORS = {
+    1: find_vertical_lines_option1,
+    2: find_vertical_lines_option2,
+    3: find_vertical_lines_option3,
+}
+
+
+def extract_layout_table(layout, vertical_line, regions=None, fingerprint=None):
+    """
+    Runs pdfplumber's table finder on a page snapshot with the given column boundaries.
+
+    With regions (a page_layout.TableRegions) and the page's header
+    fingerprint, the finder only sees the table region of the layout once
+    that is known; a crop that misses the expected header row falls back to
+    the full page.
+    """
+    if len(layout.line_boxes):
+        table_settings = {
+            "horizontal_strategy": "lines_strict",
+            "intersection_tolerance": 8,
+            "join_tolerance": 7,
+            "snap_x_tolerance": 5,
+            "explicit_vertical_lines": vertical_line
+        }
+        # debug_pic = page.to_image()
+        # debug_pic.debug_tablefinder(
+        #     table_settings={
+        #     "horizontal_strategy": "lines_strict",
+        #     "intersection_tolerance": 8,
+        #     "join_tolerance": 10,
+        #     "snap_x_tolerance": 10,
+        #     "explicit_vertical_lines": vertical_line
+        #     }
+        # )
+        # debug_image_path = f"output_tables/debug_page_{page_number+1}.png"
+        # debug_pic.save(debug_image_path)
+    else:
+        horizontal_line = get_horizontal_lines_from_rects(layout)
+        horizontal_line.append(800)
+        table_settings = {
+            "horizontal_strategy": "lines_strict",
+            "intersection_tolerance": 8,
+            "join_tolerance": 7,
+            "snap_x_tolerance": 5,
+            "explicit_vertical_lines": vertical_line,
+            "explicit_horizontal_lines": horizontal_line
+        }
+        # debug_pic = page.to_image()
+        # debug_pic.debug_tablefinder(
+        #     table_settings={
+        #     "horizontal_strategy": "lines_strict",
+        #     "intersection_tolerance": 8,
+        #     "join_tolerance": 7,
+        #     "snap_x_tolerance": 5,
+        #     "explicit_vertical_lines": vertical_line,
+        #     "explicit_horizontal_lines": horizontal_line
+        #     }
+        # )
+        # debug_image_path = f"output_tables/debug_page_{page_number+1}.png"
+        # debug_pic.save(debug_image_path)
+    known = regions.region_for(layout, fingerprint, vertical_line) if regions else None
+    if known:
+        region, header = known
+        table = layout.find_table(table_settings, region)
+        rows = table.extract() if table else None
+        if rows and rows[0] == header:
+            return rows
+    table = layout.find_table(table_settings)
+    if table is None:
+        return None
+    rows = table.extract()
+    if regions and rows:
+        regions.record(fingerprint, vertical_line, table.bbox[1], rows[0])
+    return rows
+
+
+def score_table(tables):
+    """
+    Rates how well a detector's table matches the Sennebogen schema.
+
+    Returns (recognized header columns, rows with a numeric position); tuples
+    compare the header match first, then how many part rows came out.
+    """
+    if not tables or len(tables) < 2 or not isinstance(tables[0], list):
+        return (0, 0)
+    header = [col.strip() if isinstance(col, str) else col for col in tables[0]]
+    recognized = {HEADER_MAP.get(col, col) for col in header} & set(STANDARD_COLUMNS)
+    numeric_rows = sum(1 for row in tables[1:] if row and str(row[0]).strip().isdigit())
+    return (len(recognized), numeric_rows)
+
+
+class PendingChoice(NamedTuple):
+    """
+    Rows of an auto-detected page whose layout had no detector chosen yet,
+    returned by worker processes so the parent's LayoutSelector picks.
+    """
+    fingerprint: object
+    rows: dict    # option -> rows
+    scores: dict  # option -> score_table result
+
+
+class LayoutSelector:
+    """
+    Picks the column detector for option="auto".
+
+    The first sample_pages pages of every header fingerprint are run through
+    all three detectors and scored; after that the best-scoring option is
+    frozen in decided and reused for the fingerprint for the rest of the
+    document.
+
+    When pages run in worker processes, the selector stays in the parent:
+    workers get the decided options with every page (see
+    extract_pages_watched), score pages of undecided layouts and send back
+    a PendingChoice for resolve(). Every worker therefore uses the same
+    detector for a layout, and a restarted worker loses nothing.
+    """
+
+    def __init__(self, sample_pages=3, decided=None):
+        self.sample_pages = sample_pages
+        self.scores = {}   # fingerprint -> {option: [recognized, numeric_rows]}
+        self.sampled = defaultdict(int)
+        self.decided = dict(decided or {})  # fingerprint -> option
+
+    def needs_scoring(self, fingerprint):
+        return fingerprint not in self.decided
+
+    def record(self, fingerprint, option_scores):
+        totals = self.scores.setdefault(fingerprint, {option: [0, 0] for option in DETECTORS})
+        for option, (recognized, numeric_rows) in option_scores.items():
+            totals[option][0] += recognized
+            totals[option][1] += numeric_rows
+        self.sampled[fingerprint] += 1
+        if self.sampled[fingerprint] >= self.sample_pages:
+            self.decided[fingerprint] = self.best_option(fingerprint)
+
+    def best_option(self, fingerprint):
+        if fingerprint in self.decided:
+            return self.decided[fingerprint]
+        totals = self.scores[fingerprint]
+        # ties go to the lowest option number, matching the order on the Conversions page
+        return max(sorted(totals), key=lambda option: tuple(totals[option]))
+
+    def choose(self, fingerprint, option_scores, page_number):
+        """Records a scored page and returns the option whose table the page should keep."""
+        if fingerprint in self.decided:
+            return self.decided[fingerprint]
+        previous = self.best_option(fingerprint) if fingerprint in self.scores else None
+        self.record(fingerprint, option_scores)
+        option = self.best_option(fingerprint)
+        if option != previous:
+            print(f"🔎 Page {page_number + 1}: layout {(fingerprint or 'no header')[:8]} -> Option {option}")
+        return option
+
+    def resolve(self, pending, page_number):
+        """The rows a worker's PendingChoice should contribute, scoring it if its layout is still being sampled."""
+        return pending.rows[self.choose(pending.fingerprint, pending.scores, page_number)]
+
+
+def vertical_lines_for(layout, option, templates=None, fingerprint=None):
+    """
+    Resolves the explicit vertical lines for a page with the given detector,
+    reusing the column template stored for the page's header fingerprint
+    when there is one.
+    """
+    if templates is None:
+        return DETECTORS[option](layout)
+    if fingerprint is None:
+        fingerprint = header_fingerprint(layout)
+    if fingerprint is None:
+        # nothing in the header to key on, so the page has to be measured
+        return DETECTORS[option](layout)
+    vertical_line = templates.get(fingerprint, option)
+    if vertical_line is None:
+        vertical_line = DETECTORS[option](layout)
+        templates.put(fingerprint, option, vertical_line)
+    return vertical_line
+
+
+def candidate_tables(layout, fingerprint, templates=None, regions=None):
+    """The page's table as extracted with each of the detectors, by option."""
+    candidates = {}
+    for option in DETECTORS:
+        vertical_line = vertical_lines_for(layout, option, templates, fingerprint)
+        candidates[option] = extract_layout_table(layout, vertical_line, regions, fingerprint)
+    return candidates
+
+
+def extract_auto_table(layout, selector, page_number, templates=None, regions=None):
+    """Extracts a page's table with the detector the selector picked for its header fingerprint."""
+    fingerprint = header_fingerprint(layout)
+    if not selector.needs_scoring(fingerprint):
+        option = selector.best_option(fingerprint)
+        vertical_line = vertical_lines_for(layout, option, templates, fingerprint)
+        return extract_layout_table(layout, vertical_line, regions, fingerprint)
+
+    candidates = candidate_tables(layout, fingerprint, templates, regions)
+    scores = {option: score_table(tables) for option, tables in candidates.items()}
+    return candidates[selector.choose(fingerprint, scores, page_number)]
+
+
+def table_rows(tables, page_number):
+    """A page table's rows aligned to RAW_COLUMNS, or an empty list when it is missing or malformed."""
+    if not tables:
+        return []
+    if len(tables) < 2 or not isinstance(tables[0], list):
+        print(f"⚠️ Skipping malformed table on page {page_number + 1}: {tables[0] if tables else 'empty'}")
+        return []
+    header = [col.strip() if isinstance(col, str) else col for col in tables[0]]
+    # print("Raw headers:", header)
+    return align_table_rows(header, tables[1:])
+
+
+def extract_page_rows(
+    page, page_number, option, selector=None, templates=None, profiler=NULL_PROFILER, regions=None, defer=False
+):
+    """
+    Runs line detection and table extraction for a single page.
+
+    Expects a page the pre-classifier marked as a table page. Its layout is
+    parsed once into a PageLayout snapshot that the column detectors and the
+    table finder share. With option="auto" the detector is chosen by selector
+    (a LayoutSelector); with defer=True (in worker processes) a page whose
+    layout the selector has not decided yet is not chosen here but returned as
+    a PendingChoice holding the rows of every detector. Column boundaries come
+    from templates (a ColumnTemplateCache) when the page's header layout has
+    been seen before, and the table finder only sees the layout's table region
+    once regions (a TableRegions) knows it.
+
+    Returns the page's raw rows aligned to RAW_COLUMNS (continuation lines are
+    merged later, over the whole document), or an empty list when the page
+    has no usable table.
+    """
+    with profiler.stage(page_number, "layout"):
+        layout = PageLayout(page)
+    if profiler.enabled:
+        profiler.count(
+            page_number,
+            chars=len(page.objects.get("char", [])),
+            words=len(layout.words),
+            rects=len(layout.rect_boxes),
+            lines=len(layout.line_boxes),
+        )
+    if option == AUTO:
+        with profiler.stage(page_number, "auto_select"):
+            fingerprint = header_fingerprint(layout)
+            if defer and selector.needs_scoring(fingerprint):
+                candidates = candidate_tables(layout, fingerprint, templates, regions)
+                return PendingChoice(
+                    fingerprint,
+                    {option: table_rows(tables, page_number) for option, tables in candidates.items()},
+                    {option: score_table(tables) for option, tables in candidates.items()},
+                )
+            tables = extract_auto_table(layout, selector, page_number, templates, regions)
+    else:
+        # vertical_line = infer_vertical_lines_from_text(page)
+        vertical_line = []
+        fingerprint = header_fingerprint(layout) if templates is not None or regions is not None else None
+        if option in DETECTORS:
+            with profiler.stage(page_number, "columns"):
+                vertical_line = vertical_lines_for(layout, option, templates, fingerprint)
+        # if not vertical_line:
+        #     vertical_line = infer_vertical_lines_from_text(page)
+        #     if not vertical_line:
+        #         vertical_line = [40, 95, 140, 270, 400, 430, 545]  # final fallback
+        with profiler.stage(page_number, "extract_table"):
+            tables = extract_layout_table(layout, vertical_line, regions, fingerprint)
+    with profiler.stage(page_number, "align"):
+        rows = table_rows(tables, page_number)
+    profiler.count(page_number, rows=len(rows))
+    return rows
+
+
+def classify_and_extract(
+    page,
+    page_number,
+    option,
+    selector=None,
+    templates=None,
+    index_pages=frozenset(),
+    profiler=NULL_PROFILER,
+    max_objects=None,
+    regions=None,
+    defer=False
+):
+    """
+    Parses and pre-classifies one page, extracting its rows when it is a table page.
+
+    With max_objects, pages holding more parsed objects than that raise
+    page_watchdog.PageBudgetExceeded before any layout analysis.
+
+    Returns (page kind, rows), where rows may be a PendingChoice with defer
+    (see extract_page_rows).
+    """
+    with profiler.stage(page_number, "parse"):
+        # pdfminer parses the page on first access to its objects
+        page.objects
+    check_object_budget(page, max_objects)
+    with profiler.stage(page_number, "classify"):
+        kind = classify_page(page, index_pages)
+    if kind != TABLE:
+        return kind, []
+    return kind, extract_page_rows(page, page_number, option, selector, templates, profiler, regions, defer)
+
+
+def print_page_kinds(page_kinds):
+    """Prints the tally of page kinds ({kind: count}) of a run."""
+    print("🗂️ Page types: " + ", ".join(f"{count} {kind}" for kind, count in sorted(page_kinds.items())))
+
+
+def iter_pages(pdf, option, page_numbers, templates=None, job=None, profiler=NULL_PROFILER, page_kinds=None):
+    """
+    Extracts the given pages of an open PDF, yielding (page_number, rows) in page order.
+
+    Every page is pre-classified first (see page_classifier.classify_page);
+    index, drawing and blank pages are skipped before any layout analysis.
+    With a job (a PageCheckpoint), pages it already holds are not parsed
+    again and every page that finishes without an error is saved to it.
+    The page kinds are counted into page_kinds when it is given (a shard
+    of a larger run); otherwise they are printed at the end.
+    """
+    selector = LayoutSelector() if option == AUTO else None
+    regions = TableRegions()
+    index_pages = outline_index_pages(pdf)
+    tally = defaultdict(int) if page_kinds is None else page_kinds
+    for page_number in page_numbers:
+        if job is not None:
+            rows = job.load(page_number)
+            if rows is not None:
+                tally["resumed"] += 1
+                yield page_number, rows
+                continue
+        page = pdf.pages[page_number]
+        rows = []
+        try:
+            kind, rows = classify_and_extract(
+                page, page_number, option, selector, templates, index_pages, profiler, regions=regions
+            )
+            tally[kind] += 1
+        except Exception as e:
+            print(f"Error on pathge {page_number+1}: {e}")
         else:
-            if previous_row:
-                processed.append(previous_row)
-            previous_row = row
+            if job is not None:
+                job.save(page_number, rows)
+        finally:
+            page.close()
+        yield page_number, rows
+    if page_kinds is None:
+        print_page_kinds(tally)
 
-    if previous_row:
-        processed.append(previous_row)
-    return processed
 
+def extract_pages(pdf, option, page_numbers, templates=None, job=None, profiler=NULL_PROFILER, page_kinds=None):
+    """Extracts the given pages of an open PDF. Returns a list of (page_number, rows) in page order."""
+    return list(iter_pages(pdf, option, page_numbers, templates, job, profiler, page_kinds))
 
-def normalize_headers(df: pd.DataFrame, header_map: dict) -> pd.DataFrame:
-    new_columns = {}
-    for col in df.columns:
-        new_columns[col] = header_map.get(col, col)
-    return df.rename(columns=new_columns)
 
-def get_horizontal_lines_from_rects(page, tolerance=1):
-    y_positions = []
+def extract_page_range(pdf_path, option, start, stop, template_path=None, job_dir=None, profile=False):
+    """
+    Opens the PDF on its own and extracts pages [start, stop).
+
+    This is the unit of work for the process pool, so it only takes picklable
+    arguments. The template cache is read from template_path but not written;
+    the templates learned here are returned for the parent to merge and save.
+    Finished pages are checkpointed into job_dir when one is given. With
+    profile=True the pages are timed by a StageProfiler of their own.
 
-    for rect in page.rects:
-        y0 = round(rect["top"], 1)
-        y1 = round(rect["bottom"], 1)
-        height = abs(y1 - y0)
+    Returns (list of (page_number, rows), template cache updates or None,
+    exported profile or None, {page kind: count}).
+    """
+    templates = ColumnTemplateCache(template_path) if template_path else None
+    job = PageCheckpoint(job_dir) if job_dir else None
+    profiler = StageProfiler() if profile else NULL_PROFILER
+    page_kinds = defaultdict(int)
+    with pdfplumber.open(pdf_path) as pdf:
+        results = extract_pages(pdf, option, range(start, stop), templates, job, profiler, page_kinds)
+    return (
+        results,
+        templates.export_updates() if templates else None,
+        profiler.export() if profile else None,
+        dict(page_kinds),
+    )
 
-        # Treat very short height as horizontal "line" — flat rectangle
-        if height <= tolerance:
-            y_positions.append(y0)
 
-    # Remove duplicates with tolerance
-    y_positions = sorted(set(round(y, 1) for y in y_positions))
-    return y_positions
-
-
-def align_to_standard_schema(df: pd.DataFrame, standard_columns: List[str]) -> pd.DataFrame:
-    for col in standard_columns:
-        if col not in df.columns:
-            df[col] = ""
-    return df[standard_columns]
-
-
-def extract_tables_(pdf_path, option):
-    combined_data = []
-    STANDARD_COLUMNS = ["Fig./\nPos.", "No./\nIdent.", "Nomenclature", "Benennung", "Qty./\nMenge.", "Qty. Unit/", "MPOS~Remark/Bemerkung", "see page\n s. Seite"]
-    HEADER_MAP = {
-        "Pos./\nFig.": "Fig./\nPos.",
-        "Ident./\nNo.": "No./\nIdent.",
-        "Menge\nQty.": "Qty./\nMenge.",
-        "MPOS~Bemerkung/Remark" : "MPOS~Remark/Bemerkung",
-        "s Seite\nsee page":"see page\n s. Seite",
-        "Item no." : "Fig./\nPos",
-        "SeboNr": "No./\nIdent.",
-        "Fig./\nPos": "Fig./\nPos.",
-        "Description" : "Nomenclature",
-        "Quantity" : "Qty./\nMenge.",
-        "Comment" : "MPOS~Remark/Bemerkung",
-        "Ident.\nNo.": "No./\nIdent.",
-        "Bemerkung\nRemark" : "MPOS~Remark/Bemerkung",
-        "Remark/\nBemerkung" : "MPOS~Remark/Bemerkung",
-        "Menge/\nQty.": "Qty./\nMenge.",
-        "Item\nno." : "Fig./\nPos",
-        "Quanti\nty" : "Qty./\nMenge.",
-        "Unit" : "Qty. Unit/",
-        "ME/\nQty. Unit" : "Qty. Unit/",
-        "siehe S.\nsee page" : "see page\n s. Seite",
-        "Qty. Unit/ \nQty. Unit" : "Qty. Unit/",
-        "No./\nLevel": "No./\nIdent.",
-        "see page\ns. Seite": "see page\n s. Seite",
-        "Qty./\nMenge": "Qty./\nMenge.",
-        "Iden\nNo" : "No./\nIdent.",
-        "MPOS~Bemerkung/\nRemark": "MPOS~Remark/Bemerkung",
-        "s. Seite\nsee page": "see page\n s. Seite",
-        "Level/\nNo.": "No./\nIdent."
-
-    }
+def shard_page_ranges(page_count, shard_count):
+    """Splits range(page_count) into at most shard_count contiguous (start, stop) ranges."""
+    shard_count = max(1, min(shard_count, page_count))
+    size, extra = divmod(page_count, shard_count)
+    ranges = []
+    start = 0
+    for i in range(shard_count):
+        stop = start + size + (1 if i < extra else 0)
+        if stop > start:
+            ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def extract_pages_parallel(pdf_path, option, workers, templates=None, job=None, profiler=NULL_PROFILER):
+    """
+    Extracts all pages on a process pool, yielding (page_number, rows) in page order.
+
+    Shards finish in any order; each is held until the shards before it are
+    done, so the caller can stream the rows out as they become final. The
+    shards' page kinds are added up and printed once at the end.
+    """
+    template_path = templates.path if templates else None
+    job_dir = job.job_dir if job else None
+    source, temp_path = spool_to_temp_file(pdf_path)
+    try:
+        with pdfplumber.open(source) as pdf:
+            page_count = len(pdf.pages)
+        shards = shard_page_ranges(page_count, workers * SHARDS_PER_WORKER)
+        finished = {}
+        next_shard = 0
+        page_kinds = defaultdict(int)
+        # spawn keeps workers independent of the threads Streamlit runs us in
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor, \
+                tqdm(total=page_count, desc="Processing Pages") as progress:
+            futures = {
+                executor.submit(
+                    extract_page_range, source, option, start, stop, template_path, job_dir, profiler.enabled
+                ): i
+                for i, (start, stop) in enumerate(shards)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                start, stop = shards[i]
+                try:
+                    shard_results, template_updates, profile, shard_kinds = future.result()
+                    for kind, count in shard_kinds.items():
+                        page_kinds[kind] += count
+                    if template_updates:
+                        templates.merge_updates(template_updates)
+                    if profile:
+                        profiler.merge(profile)
+                except Exception as e:
+                    print(f"Error on pages {start+1}-{stop}: {e}")
+                    shard_results = [(page_number, []) for page_number in range(start, stop)]
+                finished[i] = shard_results
+                progress.update(stop - start)
+                while next_shard in finished:
+                    yield from finished.pop(next_shard)
+                    next_shard += 1
+        print_page_kinds(page_kinds)
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+def watched_page_task(pdf, option, template_path=None, max_objects=MAX_PAGE_OBJECTS, profile=False):
+    """
+    Builds the page task a page_watchdog worker runs for every page of pdf.
+
+    The task returns (page kind, rows, template cache updates or None,
+    exported profile or None) for one page, so nothing a worker learned is
+    lost when a later page gets it killed. With option="auto" it is called
+    with the parent's decided detectors (LayoutSelector.decided) and returns
+    a PendingChoice as rows for pages of undecided layouts.
+    """
+    selector = LayoutSelector() if option == AUTO else None
+    templates = ColumnTemplateCache(template_path) if template_path else None
+    regions = TableRegions()
+    index_pages = outline_index_pages(pdf)
+
+    def task(page, page_number, decided=None):
+        if decided:
+            selector.decided.update(decided)
+        profiler = StageProfiler() if profile else NULL_PROFILER
+        kind, rows = classify_and_extract(
+            page, page_number, option, selector, templates, index_pages, profiler, max_objects, regions,
+            defer=selector is not None
+        )
+        return (
+            kind,
+            rows,
+            templates.take_updates() if templates else None,
+            profiler.export() if profile else None,
+        )
+
+    return task
+
+
+def extract_pages_watched(
+    pdf_path,
+    option,
+    page_timeout=PAGE_TIMEOUT,
+    max_objects=MAX_PAGE_OBJECTS,
+    workers=1,
+    templates=None,
+    job=None,
+    profiler=NULL_PROFILER,
+    review=None
+):
+    """
+    Extracts all pages under a page_watchdog.PageWatchdog, yielding (page_number, rows) in page order.
+
+    Every page runs in a worker process and is abandoned after page_timeout
+    seconds or when it holds more than max_objects objects; such pages yield
+    no rows and are appended to review as (page_number, reason) (see
+    page_watchdog.watch_document).
+
+    With option="auto" the LayoutSelector lives here: every page is sent
+    with the detectors decided so far, and the scores of sampled pages come
+    back to it, so all workers agree on one detector per layout.
+    """
+    template_path = templates.path if templates else None
+    task_args = (option, template_path, max_objects, profiler.enabled)
+    selector = LayoutSelector() if option == AUTO else None
+    context = (lambda page_number: dict(selector.decided)) if selector else None
+    page_kinds = defaultdict(int)
+    for page_number, status, value in watch_document(
+        pdf_path, watched_page_task, task_args, page_timeout, workers, job, review, context
+    ):
+        rows = []
+        if status == RESUMED:
+            rows = value
+        elif status == DONE:
+            kind, rows, template_updates, profile = value
+            if isinstance(rows, PendingChoice):
+                rows = selector.resolve(rows, page_number)
+            status = kind
+            if template_updates:
+                templates.merge_updates(template_updates)
+            if profile:
+                profiler.merge(profile)
+            if job:
+                job.save(page_number, rows)
+        page_kinds[status] += 1
+        yield page_number, rows
+    print_page_kinds(page_kinds)
+
+
+def iter_document_pages(
+    pdf_path,
+    option,
+    workers=1,
+    templates=None,
+    job=None,
+    profiler=NULL_PROFILER,
+    page_timeout=None,
+    max_objects=MAX_PAGE_OBJECTS,
+    review=None
+):
+    """
+    Yields (page_number, rows) for every page of the PDF.
+
+    With a page_timeout, pages run under the page watchdog on workers
+    processes (see extract_pages_watched); otherwise on a process pool of
+    contiguous shards when workers > 1, or in this process. Auto-detection
+    on several workers always goes through the watchdog's page-by-page
+    dispatch (without a time limit when page_timeout is None), since shards
+    would each pick detectors on their own.
+    """
+    if page_timeout is not None or (option == AUTO and workers > 1):
+        yield from extract_pages_watched(
+            pdf_path, option, page_timeout, max_objects, workers, templates, job, profiler, review
+        )
+        return
+    if workers > 1:
+        yield from extract_pages_parallel(pdf_path, option, workers, templates, job, profiler)
+        return
     with pdfplumber.open(pdf_path) as pdf:
+        page_numbers = tqdm(range(len(pdf.pages)), desc="Processing Pages")
+        yield from iter_pages(pdf, option, page_numbers, templates, job, profiler)
+
+
+def extract_tables_(
+    pdf_path,
+    option,
+    workers=1,
+    template_cache=TEMPLATE_CACHE_FILE,
+    output_format=XLSX,
+    output_path=None,
+    checkpoint_dir=CHECKPOINT_DIR,
+    profiler=None,
+    page_timeout=PAGE_TIMEOUT,
+    max_page_objects=MAX_PAGE_OBJECTS,
+    review=None
+):
+    """
+    Extracts the parts tables of a Sennebogen manual into a styled Excel file,
+    or a CSV/Parquet file for imports.
 
-        for page_number, page in enumerate(tqdm(pdf.pages, desc="Processing Pages")):
-            page_text = page.extract_text()
-            try:              
-                if page_text and ("Inhaltsverzeichnis" in page_text or "index" in page_text.lower()):
-                    continue
-                # vertical_line = infer_vertical_lines_from_text(page)
-                vertical_line = []
-                if option == 1:
-                    vertical_line = find_vertical_lines_option1(page)
-                elif option == 2:
-                    vertical_line = find_vertical_lines_option2(page)
-                elif option == 3:
-                    vertical_line = find_vertical_lines_option3(page)
-                # if not vertical_line:
-                #     vertical_line = infer_vertical_lines_from_text(page)
-                #     if not vertical_line:
-                #         vertical_line = [40, 95, 140, 270, 400, 430, 545]  # final fallback
-                if page.lines:
-                    tables = page.extract_table(table_settings= {
-                        "horizontal_strategy": "lines_strict",
-                        "intersection_tolerance": 8,
-                        "join_tolerance": 7,
-                        "snap_x_tolerance": 5,
-                        "explicit_vertical_lines": vertical_line
-                    })
-                    # debug_pic = page.to_image()
-                    # debug_pic.debug_tablefinder(
-                    #     table_settings={
-                    #     "horizontal_strategy": "lines_strict",
-                    #     "intersection_tolerance": 8,
-                    #     "join_tolerance": 10,
-                    #     "snap_x_tolerance": 10,
-                    #     "explicit_vertical_lines": vertical_line
-                    #     }
-                    # )
-                    # debug_image_path = f"output_tables/debug_page_{page_number+1}.png"
-                    # debug_pic.save(debug_image_path)
-                else:
-                    horizontal_line = get_horizontal_lines_from_rects(page)
-                    horizontal_line.append(800)
-                    tables = page.extract_table(table_settings= {
-                        "horizontal_strategy": "lines_strict",
-                        "intersection_tolerance": 8,
-                        "join_tolerance": 7,
-                        "snap_x_tolerance": 5,
-                        "explicit_vertical_lines": vertical_line,
-                        "explicit_horizontal_lines": horizontal_line
-                    })
-                    # debug_pic = page.to_image()
-                    # debug_pic.debug_tablefinder(
-                    #     table_settings={
-                    #     "horizontal_strategy": "lines_strict",
-                    #     "intersection_tolerance": 8,
-                    #     "join_tolerance": 7,
-                    #     "snap_x_tolerance": 5,
-                    #     "explicit_vertical_lines": vertical_line,
-                    #     "explicit_horizontal_lines": horizontal_line
-                    #     }
-                    # )
-                    # debug_image_path = f"output_tables/debug_page_{page_number+1}.png"
-                    # debug_pic.save(debug_image_path)
-                i = 0
-                if tables:   
-                    if len(tables) < 2 or not isinstance(tables[0], list):
-                        print(f"⚠️ Skipping malformed table on page {page_number + 1}: {tables[0] if tables else 'empty'}")
-                        continue  
-                    header = [col.strip() if isinstance(col, str) else col for col in tables[0]]
-                    # print("Raw headers:", header)
-                    raw_rows = tables[1:]
-                    df = pd.DataFrame(raw_rows, columns=header)
-                    df = normalize_headers(df, HEADER_MAP)
-                    # print("Mapped headers:", df.columns.tolist())
-                    for col in df.columns:
-                        if col not in HEADER_MAP and col not in STANDARD_COLUMNS:
-                            print(f"⚠️ Unmapped column: {repr(col)}")
-                    flattened_data = flatten_rows(df.values.tolist())
-                    df = pd.DataFrame(flattened_data, columns=df.columns)
-                    df = align_to_standard_schema(df, STANDARD_COLUMNS)
-                    combined_data.append(df)
-
-            except Exception as e:
-                print(f"Error on pathge {page_number+1}: {e}")
-    if combined_data:
-        combined_df = pd.concat(combined_data, ignore_index=True)
-        output_stream = BytesIO()
-    else:
-        combined_df = pd.DataFrame()
-        output_stream = BytesIO()
+    Pages are released as soon as their rows are out and parts are written
+    in batches as they complete, so memory stays flat however long the
+    manual is; the peak is printed at the end.
+
+    Args:
+        pdf_path: path or file-like object of the PDF
+        option: vertical-line detection algorithm (1, 2 or 3), or "auto" to
+            score all three on a few pages per header layout and keep the best
+        workers: number of processes; with page_timeout=None pages are split
+            into contiguous shards when greater than 1
+        template_cache: path of the column template store shared across
+            manuals, or None to detect the columns of every page from scratch
+        output_format: "xlsx", "csv" or "parquet"; CSV and Parquet store the
+            quantity as a number and Parquet the unit as a category
+        output_path: file to write to; by default the output stays in memory
+        checkpoint_dir: where finished pages are checkpointed, so a rerun of
+            the same PDF after a crash resumes instead of starting over; the
+            job is removed once the output is written. None disables it.
+        profiler: a profiling.StageProfiler to record per-page stage times
+            and object counts in (see StageProfiler.report for the slow-page
+            report); None for no profiling
+        page_timeout: seconds a page may take before it is abandoned; pages
+            then run in watchdog worker processes (workers of them), and
+            pages over the time or max_page_objects budget are listed on a
+            "Needs Review" sheet instead of stalling the conversion. None
+            runs the pages without a budget.
+        max_page_objects: parsed objects (chars, lines, curves, ...) above
+            which a page is not extracted; None for no limit
+        review: list the skipped pages are appended to as (page_number,
+            reason), so callers can tell an incomplete output apart
+
+    Returns:
+        output_path, or a file object with the output (spooled to a temp file
+        once large) when no path was given.
+    """
+    profiler = profiler or NULL_PROFILER
+    templates = ColumnTemplateCache(template_cache) if template_cache else None
+    job = open_job(pdf_path, "sennebogen", EXTRACTOR_VERSION, [option], checkpoint_dir) if checkpoint_dir else None
     # combined_df = ""
     # output_stream = ""
     # col_count = len(combined_data[0])
@@ -361,46 +922,44 @@ def extract_tables_(pdf_path, option):
    
     # make excel pretty
     MAX_COL_WIDTH = 50  # set your preferred maximum
-
-    with pd.ExcelWriter(output_stream, engine='openpyxl') as writer:
-        combined_df.to_excel(writer, index=False, sheet_name='Combined Output')
-
-    output_stream.seek(0)
-    from openpyxl import load_workbook
-    wb = load_workbook(output_stream)
-    sheet = wb.active
-
-    # Adjust column widths
-    for column in sheet.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except Exception:
-                pass
-        adjusted_width = min(max_length + 2, MAX_COL_WIDTH)
-        sheet.column_dimensions[column_letter].width = adjusted_width
-
-    # Bold header row
-    for cell in sheet[1]:
-        cell.font = Font(bold=True)
-
-    # Apply center alignment + wrap text + thin borders
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    writer = open_table_writer(
+        output_format,
+        STANDARD_COLUMNS,
+        output_path,
+        numeric=[QUANTITY_COLUMN],
+        categorical=[UNIT_COLUMN],
+        max_col_width=MAX_COL_WIDTH,
+        wrap_text=True
     )
-    for row in sheet.iter_rows():
-        for cell in row:
-            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-            cell.border = thin_border
-
-    # Save final output
-    output_stream = BytesIO()
-    wb.save(output_stream)
-    output_stream.seek(0)
-    return output_stream
\ No newline at end of file
+    merger = ContinuationMerger()
+    review = [] if review is None else review
+    try:
+        pages = iter_document_pages(
+            pdf_path, option, workers, templates, job, profiler, page_timeout, max_page_objects, review
+        )
+        for _, rows in pages:
+            with profiler.stage(DOCUMENT, "merge"):
+                merged = merger.feed(rows)
+            with profiler.stage(DOCUMENT, "write"):
+                writer.write(merged)
+        with profiler.stage(DOCUMENT, "merge"):
+            merged = merger.finish()
+        with profiler.stage(DOCUMENT, "write"):
+            writer.write(merged)
+        write_review_sheet(writer, review)
+    except BaseException:
+        if job:
+            job.release()
+        raise
+    finally:
+        with profiler.stage(DOCUMENT, "write"):
+            output = writer.close()
+    if templates:
+        stats = templates.stats()
+        print(f"📐 Column templates: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} stored")
+        templates.save()
+    if job:
+        job.finish()
+    print_peak_memory()
+    return output
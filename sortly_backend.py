@@ -4,56 +4,240 @@ import pandas as pd
 import requests
 import time
 import os
-import json
-from datetime import datetime, timedelta
+import random
+import threading
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+
+from stock_map_store import StockMapStore, updated_timestamp
 
 # --- Configuration (These can stay here) ---
 API_BASE = "https://api.sortly.co/api/v1"
 STOCK_NUMBER_COLUMN = "Stock #"
 PRICE_COLUMN = "Value"
 SKIP_ROWS = 4
-CACHE_FILE_NAME = "sortly_map_cache.json"
-CACHE_DURATION_SECONDS = 3600 # Cache valid for 1 hour
+FULL_SYNC_SECONDS = 24 * 3600 # Rebuild the whole map at least this often, dropping items deleted in Sortly
+PAGE_SIZE = 100
+# Asks for the catalog newest change first, so an incremental sync can stop at the last one it saw
+SORT_NEWEST_FIRST = {"sort_by": "updated_at", "sort_order": "desc"}
+UPDATE_WORKERS = 8 # Price updates in flight at once; the rate limiter still caps the request rate
+REQUEST_TIMEOUT = 30 # Seconds to wait for Sortly to answer a request
+MAX_RETRIES = 5 # Retries of a request that hit a rate limit, a server error or a dropped connection
+BACKOFF_SECONDS = 1 # First retry delay, doubled on every further retry
+MAX_BACKOFF_SECONDS = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Rate-limit headers Sortly sends with every response
+RATE_LIMIT_REMAINING_HEADER = "Sortly-Rate-Limit-Remaining"
+RATE_LIMIT_RESET_HEADER = "Sortly-Rate-Limit-Reset"
 
 class RateLimiter:
-    # ... (no changes to this class, it's perfect as is) ...
+    """
+    Sliding-window log of the requests made, shared by every thread talking
+    to the API.
+
+    A request goes ahead as long as fewer than max_requests (less the safety
+    buffer) were sent in the last time_window, so the workers can use the
+    whole quota at full speed and never exceed it over any window. Each
+    request is recorded under the lock as it is allowed, so concurrent
+    threads cannot all pass the check at once.
+    """
     def __init__(self, max_requests=1000, time_window=15*60, safety_buffer=50):
         self.max_requests = max_requests - safety_buffer
         self.time_window = time_window
         self.requests = deque()
-    def wait_if_needed(self):
-        now = datetime.now()
-        while self.requests and self.requests[0] <= now - timedelta(seconds=self.time_window):
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        while self.requests and self.requests[0] <= now - self.time_window:
             self.requests.popleft()
-        if len(self.requests) >= self.max_requests:
-            oldest_request = self.requests[0]
-            wait_time = (oldest_request + timedelta(seconds=self.time_window) - now).total_seconds()
-            if wait_time > 0:
-                # This will now be handled by the callback
-                pass
-                #print(f"⏳ Rate limit reached. Waiting for {wait_time:.1f} seconds...")
-                time.sleep(wait_time + 1)
-    def record_request(self):
-        self.requests.append(datetime.now())
+
+    def acquire(self):
+        """Records one request, sleeping until the window has room for it; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._expire(now)
+                if now < self.paused_until:
+                    wait_time = self.paused_until - now
+                elif len(self.requests) < self.max_requests:
+                    self.requests.append(now)
+                    return waited
+                else:
+                    wait_time = self.requests[0] + self.time_window - now
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def pause(self, seconds):
+        """Holds every thread's next request for seconds, e.g. after the server answered 429."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe(self, remaining, reset_seconds=None):
+        """
+        Lines the log up with the server's own count: never more requests
+        allowed than it says are left, and none at all until its window
+        resets once none are left.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._expire(now)
+            # requests made elsewhere with the same token count against our window from now on
+            while self.max_requests - len(self.requests) > max(0, remaining):
+                self.requests.append(now)
+            if remaining <= 0 and reset_seconds:
+                self.paused_until = max(self.paused_until, now + reset_seconds)
+
+
+def _server_time(response):
+    """When the server answered, by its own clock (the Date header), as a timestamp; our clock if it sent none."""
+    try:
+        return parsedate_to_datetime(response.headers["Date"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+def _retry_after_seconds(value):
+    """Seconds asked for by a Retry-After header, given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class SortlyClient:
+    """
+    Sortly API client sharing one keep-alive connection pool between threads.
+
+    Every request waits for room in the shared RateLimiter first. Requests
+    answered with 429 or a 5xx, and dropped connections, are retried up to
+    max_retries times, waiting as long as Retry-After asks or else with
+    jittered exponential backoff; a 429 pauses the limiter, so the other
+    threads back off too. The rate-limit headers of every response are fed
+    back into the limiter.
+    """
+    def __init__(self, api_token, limiter=None, pool_size=UPDATE_WORKERS, max_retries=MAX_RETRIES):
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Accept": "application/json", "Content-Type": "application/json", "Authorization": f"Bearer {api_token}"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _observe(self, response):
+        try:
+            remaining = int(response.headers[RATE_LIMIT_REMAINING_HEADER])
+        except (KeyError, ValueError):
+            return
+        self.limiter.observe(remaining, _retry_after_seconds(response.headers.get(RATE_LIMIT_RESET_HEADER)))
+
+    def _backoff(self, attempt):
+        return random.uniform(0.5, 1) * min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt)
+
+    def request(self, method, path, output_callback=None, **kwargs):
+        """
+        Sends a request to API_BASE + path and returns the response; raises
+        requests.exceptions.RequestException once retries are used up or for
+        errors that retrying will not fix. output_callback, if given, hears
+        about rate-limit waits and retries.
+        """
+        output_callback = output_callback or (lambda message: None)
+        url = f"{API_BASE}{path}"
+        for attempt in range(self.max_retries + 1):
+            waited = self.limiter.acquire()
+            if waited >= 1:
+                output_callback(f"⏳ Rate limit reached. Waited {waited:.1f} seconds.")
+            try:
+                response = self.session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                output_callback(f"🔁 {e.__class__.__name__} on {method} {path}; retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+                continue
+            self._observe(response)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                response.raise_for_status()
+                return response
+            delay = _retry_after_seconds(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = self._backoff(attempt)
+            if response.status_code == 429:
+                self.limiter.pause(delay)
+            output_callback(f"🔁 HTTP {response.status_code} on {method} {path}; retrying in {delay:.1f} seconds...")
+            time.sleep(delay)
+
+    def list_items(self, page, per_page=PAGE_SIZE, output_callback=None, params=None):
+        """
+        One page of the catalog (folders and items) and the server's time of
+        the answer, as (items, timestamp); params adds query parameters such
+        as the sort order.
+        """
+        params = dict(params or {}, per_page=per_page, page=page)
+        response = self.request("GET", "/items", output_callback, params=params)
+        return response.json().get("data", []), _server_time(response)
+
+    def update_item(self, item_id, payload, output_callback=None):
+        return self.request("PUT", f"/items/{item_id}", output_callback, json=payload)
 
 
 # --- API & Map Functions (Modified to accept a callback for logging) ---
 
-def fetch_sortly_items_and_build_map(limiter, headers, output_callback):
+def _map_entry(item):
+    """What the stock map keeps of a Sortly item: enough to update it and to tell whether it needs updating."""
+    return {"id": item["id"], "name": item["name"], "price": item.get("price"), "updated_at": item.get("updated_at")}
+
+def _stock_number(name):
+    """The Stock # of an item: the first word of its name."""
+    stock_number = name.split()[0]
+    if stock_number.endswith(".0"): stock_number = stock_number[:-2]
+    return stock_number
+
+def _price_cents(price):
+    """A price in whole cents, so sheet and Sortly prices compare exactly; None when it is not a number."""
+    try:
+        return round(float(price) * 100)
+    except (TypeError, ValueError):
+        return None
+
+def fetch_sortly_items_and_build_map(client, output_callback):
+    """
+    Reads the whole catalog into a {Stock #: entry} map. Returns the map, or
+    None when the API failed, and the server's time of the first page (None
+    if not even that came back): changes made after it may be missing.
+    """
     output_callback("🚀 Starting to fetch all items to build a map from Stock # (first word of item name)...")
     stock_number_map = {}
     page = 1
     items_with_no_name = 0
+    started = None
     while True:
-        limiter.wait_if_needed()
-        url = f"{API_BASE}/items"
-        params = {"per_page": 100, "page": page} 
         try:
-            response = requests.get(url, headers=headers, params=params)
-            limiter.record_request()
-            response.raise_for_status()
-            data = response.json().get("data", [])
+            data, answered = client.list_items(page, output_callback=output_callback)
+            if started is None:
+                started = answered
             if not data:
                 output_callback("✅ Finished fetching all items.")
                 break 
@@ -61,44 +245,104 @@ def fetch_sortly_items_and_build_map(limiter, headers, output_callback):
                 if item.get("type") == "item":
                     full_name = item.get("name")
                     if full_name:
-                        stock_number = full_name.split()[0]
-                        if stock_number.endswith(".0"): stock_number = stock_number[:-2]
-                        stock_number_map[stock_number] = {"id": item["id"], "name": full_name}
+                        stock_number_map[_stock_number(full_name)] = _map_entry(item)
                     else: items_with_no_name += 1
             output_callback(f"📄 Fetched page {page}. Total items mapped so far: {len(stock_number_map)}")
             page += 1
         except requests.exceptions.RequestException as e:
             output_callback(f"❌ Error fetching items on page {page}: {e}")
             if hasattr(e.response, 'text'): output_callback(f"Response: {e.response.text}")
-            return None
+            return None, started
     if items_with_no_name > 0:
         output_callback(f"⚠️  Note: {items_with_no_name} items in Sortly had no name and were skipped.")
-    return stock_number_map
-
-def get_or_create_stock_map(limiter, headers, output_callback):
-    if os.path.exists(CACHE_FILE_NAME):
-        file_age = time.time() - os.path.getmtime(CACHE_FILE_NAME)
-        if file_age < CACHE_DURATION_SECONDS:
-            output_callback(f"✅ Found recent cache file. Loading map from '{CACHE_FILE_NAME}'...")
-            with open(CACHE_FILE_NAME, 'r') as f: return json.load(f)
-    output_callback("ℹ️ Cache is old or missing. Fetching new map from Sortly API.")
-    stock_map = fetch_sortly_items_and_build_map(limiter, headers, output_callback)
-    if stock_map:
-        output_callback(f"💾 Saving new map to cache file: '{CACHE_FILE_NAME}'")
-        with open(CACHE_FILE_NAME, 'w') as f: json.dump(stock_map, f, indent=4)
-    return stock_map
-
-def update_item_price(item_id, item_name, new_price, limiter, headers, output_callback):
-    limiter.wait_if_needed()
-    if len(limiter.requests) >= limiter.max_requests:
-         output_callback(f"⏳ Rate limit reached. Waiting for a moment...")
-
-    url = f"{API_BASE}/items/{item_id}"
+    return stock_number_map, started
+
+def sync_stock_map(client, store, output_callback):
+    """
+    Brings the stored map up to date by fetching only the items changed
+    since it was built, newest first, down to its watermark (the latest
+    updated_at it holds, but no later than the start of the last sync; see
+    StockMapStore.watermark), and merging them in one transaction. Renamed items
+    move to their new Stock #. Every page read is checked to really be
+    newest first, since an API that ignored the sort order would end the
+    sync early with changes missed.
+
+    Items deleted in Sortly are not noticed; a full rebuild drops them.
+
+    Returns:
+        number of items fetched again
+
+    Raises:
+        ValueError: the map has no watermark, or the API did not return the
+            items newest first, so stopping early could miss changes
+        requests.exceptions.RequestException: the API failed
+    """
+    watermark = store.watermark()
+    if watermark is None:
+        raise ValueError("the stored map has no updated_at times")
+    changed, page, previous, started = {}, 1, None, None
+    while True:
+        data, answered = client.list_items(page, output_callback=output_callback, params=SORT_NEWEST_FIRST)
+        if started is None:
+            started = answered
+        caught_up = not data
+        for item in data:
+            updated = updated_timestamp(item.get("updated_at"))
+            if updated is None or (previous is not None and updated > previous):
+                raise ValueError("the API did not return items newest first")
+            previous = updated
+            # the rest of the page is still read, so its order is checked as well;
+            # items changed at the watermark itself are fetched again, in case of ties
+            if updated < watermark:
+                caught_up = True
+            if caught_up or item.get("type") != "item" or not item.get("name"):
+                continue
+            # newest first, so an item seen twice (it changed mid-sync) keeps its newest state
+            changed.setdefault(item["id"], (_stock_number(item["name"]), _map_entry(item)))
+        if caught_up:
+            store.upsert(changed.values(), started)
+            return len(changed)
+        page += 1
+
+def get_or_create_stock_map(client, output_callback, full_sync=False, store=None):
+    """
+    The StockMapStore, brought up to date with an incremental sync, or
+    rebuilt from the whole catalog when full_sync is set, when it is empty,
+    when the last full rebuild is older than FULL_SYNC_SECONDS, or when the
+    incremental sync is not possible. None when the API failed.
+    """
+    if store is None:
+        store = StockMapStore()
+    full_synced_at = store.full_synced_at()
+    if full_sync:
+        output_callback("ℹ️ Full rebuild requested. Fetching new map from Sortly API.")
+    elif full_synced_at is None or time.time() - full_synced_at >= FULL_SYNC_SECONDS:
+        output_callback("ℹ️ Stored map is old or missing. Fetching new map from Sortly API.")
+    else:
+        output_callback(f"🔄 Fetching items changed since the last sync into '{store.path}'...")
+        try:
+            changed = sync_stock_map(client, store, output_callback)
+        except ValueError as e:
+            output_callback(f"⚠️ Incremental sync not possible ({e}). Rebuilding the whole map.")
+        except requests.exceptions.RequestException as e:
+            output_callback(f"❌ Error syncing changed items: {e}")
+            return None
+        else:
+            output_callback(f"✅ Map is up to date: {changed} item(s) changed since the last sync.")
+            return store
+    requested = time.time()
+    stock_map, started = fetch_sortly_items_and_build_map(client, output_callback)
+    if not stock_map:
+        return None
+    output_callback(f"💾 Saving new map to '{store.path}'")
+    # the rebuild's age is judged by our clock, the next sync's watermark by Sortly's
+    store.replace_all(stock_map, requested, started)
+    return store
+
+def update_item_price(client, item_id, item_name, new_price, output_callback):
     payload = {"name": item_name, "price": new_price, "type": "item"}
     try:
-        response = requests.put(url, headers=headers, json=payload)
-        limiter.record_request()
-        response.raise_for_status()
+        client.update_item(item_id, payload, output_callback)
         output_callback(f"✅ Successfully updated '{item_name}' (ID: {item_id}) to price: {new_price}")
         return True
     except requests.exceptions.RequestException as e:
@@ -106,16 +350,93 @@ def update_item_price(item_id, item_name, new_price, limiter, headers, output_ca
         if hasattr(e.response, 'text'): output_callback(f"   Response Body: {e.response.text}")
         return False
 
+def _update_one(update, client):
+    """Runs one price update on a pool thread, keeping its messages for the caller to report."""
+    stock_number, item_id, item_name, new_price = update
+    messages = []
+    ok = update_item_price(client, item_id, item_name, new_price, messages.append)
+    return ok, messages
+
+def update_prices(updates, client, output_callback, workers=UPDATE_WORKERS):
+    """
+    Sends price updates on a thread pool, so throughput is bound by the rate
+    limiter rather than by one request's round trip.
+
+    Args:
+        updates: list of (stock number, item id, item name, new price)
+        client: the SortlyClient (and so the RateLimiter and connection
+            pool) all threads share
+        output_callback: called from this thread only, with each update's
+            messages in input order (an update is reported once it and every
+            update before it have finished)
+        workers: number of updates in flight at once
+
+    Returns:
+        list of True/False per update, in input order
+    """
+    results = [None] * len(updates)
+    reported = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_update_one, update, client): i for i, update in enumerate(updates)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = (False, [f"❌ Error updating Stock # '{updates[i][0]}': {e}"])
+            while reported < len(updates) and results[reported] is not None:
+                for message in results[reported][1]:
+                    output_callback(message)
+                reported += 1
+    return [ok for ok, _ in results]
+
+def plan_price_updates(df, store):
+    """
+    Works out the minimal set of price updates for a price sheet.
+
+    Rows without a stock number or price are ignored, and when a stock
+    number appears more than once its last row wins. Only the sheet's stock
+    numbers are looked up in the store. A row is only sent to Sortly when
+    its price differs from the one in the stock map (compared in cents);
+    entries without a known price are always updated.
+
+    Returns:
+        (updates as (stock number, item id, item name, new price), stock
+        numbers whose price is already current, stock numbers not in the map)
+    """
+    prices = {}
+    for stock_number, new_price in zip(df[STOCK_NUMBER_COLUMN], df[PRICE_COLUMN]):
+        if pd.isna(stock_number) or pd.isna(new_price): continue
+        stock_number_str = str(stock_number).strip()
+        if stock_number_str.endswith(".0"): stock_number_str = stock_number_str[:-2]
+        # numpy scalars from the sheet become plain numbers, which JSON can carry
+        prices[stock_number_str] = new_price.item() if hasattr(new_price, "item") else new_price
+
+    stock_map = store.lookup(prices)
+    updates, unchanged, items_not_found = [], [], []
+    for stock_number_str, new_price in prices.items():
+        item_data = stock_map.get(stock_number_str)
+        if not item_data:
+            items_not_found.append(stock_number_str)
+            continue
+        current = _price_cents(item_data.get("price"))
+        if current is not None and current == _price_cents(new_price):
+            unchanged.append(stock_number_str)
+        else:
+            updates.append((stock_number_str, item_data['id'], item_data['name'], new_price))
+    return updates, unchanged, items_not_found
+
 # --- Main Callable Function for the App ---
 
-def run_update_process(api_token, uploaded_file, output_callback):
-    """The main entry point for the Streamlit app to call."""
-    headers = {"Accept": "application/json", "Content-Type": "application/json", "Authorization": f"Bearer {api_token}"}
-    rate_limiter = RateLimiter()
-    
+def run_update_process(api_token, uploaded_file, output_callback, full_sync=False):
+    """The main entry point for the Streamlit app to call; full_sync rebuilds the item map from scratch."""
+    with SortlyClient(api_token) as client:
+        _run_update_process(client, uploaded_file, output_callback, full_sync)
+
+def _run_update_process(client, uploaded_file, output_callback, full_sync=False):
     # 1. Get the Stock # to Item ID map
-    stock_to_item_data_map = get_or_create_stock_map(rate_limiter, headers, output_callback)
-    if not stock_to_item_data_map:
+    store = get_or_create_stock_map(client, output_callback, full_sync)
+    if not store:
         output_callback("Halting script: could not load or create the item map.")
         return
 
@@ -134,30 +455,21 @@ def run_update_process(api_token, uploaded_file, output_callback):
         output_callback(f"❌ Error reading Excel file: {e}")
         return
 
-    # 3. Iterate through Excel rows and update prices
+    # 3. Compare the sheet with Sortly and update only the prices that changed
     output_callback("\n🔄 Starting to process Excel rows and update prices in Sortly...")
-    items_not_found, successful_updates, failed_updates = [], 0, 0
-    
-    for index, row in df.iterrows():
-        stock_number, new_price = row.get(STOCK_NUMBER_COLUMN), row.get(PRICE_COLUMN)
-        if pd.isna(stock_number) or pd.isna(new_price): continue
+    updates, unchanged, items_not_found = plan_price_updates(df, store)
+    for stock_number_str in items_not_found:
+        output_callback(f"⚠️  Stock # from Excel not found in Sortly map: '{stock_number_str}'")
+    output_callback(f"🧮 {len(updates)} price(s) changed; {len(unchanged)} already match Sortly and are skipped.")
 
-        stock_number_str = str(stock_number).strip()
-        if stock_number_str.endswith(".0"): stock_number_str = stock_number_str[:-2]
-        
-        item_data = stock_to_item_data_map.get(stock_number_str)
-        if item_data:
-            if update_item_price(item_data['id'], item_data['name'], new_price, rate_limiter, headers, output_callback):
-                successful_updates += 1
-            else:
-                failed_updates += 1
-        else:
-            output_callback(f"⚠️  Stock # from Excel not found in Sortly map: '{stock_number_str}'")
-            items_not_found.append(stock_number_str)
+    outcomes = update_prices(updates, client, output_callback)
+    successful_updates = sum(outcomes)
+    failed_updates = len(outcomes) - successful_updates
 
     # 4. Final Report
     output_callback("\n\n--- 📊 Update Complete ---")
     output_callback(f"✅ Successful updates: {successful_updates}")
+    output_callback(f"⏭️ Unchanged prices skipped: {len(unchanged)}")
     output_callback(f"❌ Failed updates: {failed_updates}")
     output_callback(f"❓ Stock #s in Excel not found in Sortly map: {len(items_not_found)}")
     if items_not_found:
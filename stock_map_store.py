@@ -0,0 +1,146 @@
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime
+
+STOCK_MAP_DB = "sortly_stock_map.db"
+# Stock numbers looked up per query, well below SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    stock_number TEXT PRIMARY KEY,
+    item_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    price,
+    updated_at TEXT,
+    updated_ts REAL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_item_id ON items (item_id);
+CREATE INDEX IF NOT EXISTS items_updated ON items (updated_ts);
+CREATE TABLE IF NOT EXISTS sync_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    full_synced_at REAL,
+    sync_started_at REAL
+);
+"""
+
+
+def updated_timestamp(updated_at):
+    """An item's updated_at (ISO 8601, as Sortly sends it) as seconds since the epoch, or None."""
+    try:
+        return datetime.fromisoformat(updated_at).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class StockMapStore:
+    """
+    The Stock # -> Sortly item map in SQLite, one row per item.
+
+    Rows are keyed by stock number and indexed by item id and updated_at, so
+    runs look up only the stock numbers of their sheet and the incremental
+    sync finds its watermark without loading the map. Every row records when
+    it was last synced, and sync_state when the last sync started reading the
+    catalog, by the server's clock. Writes are transactions: a crash mid-sync
+    leaves the previous map intact. Like JobStore, every call opens its own
+    short-lived connection.
+    """
+
+    def __init__(self, path=STOCK_MAP_DB):
+        self.path = path
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # autocommit; multi-statement updates take the write lock with BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def full_synced_at(self):
+        """Time of the last full rebuild, or None if the map was never built."""
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT full_synced_at FROM sync_state WHERE id = 1").fetchone()
+        return row[0] if row else None
+
+    def watermark(self):
+        """
+        The time from which the next incremental sync must fetch changes, or
+        None: the latest updated_at in the map, but no later than the start
+        of the last sync. An item changed while a sync was paging through
+        the catalog may have been missed by it, yet older than the newest
+        item it did see.
+        """
+        with closing(self._connect()) as db:
+            latest = db.execute("SELECT MAX(updated_ts) FROM items").fetchone()[0]
+            row = db.execute("SELECT sync_started_at FROM sync_state WHERE id = 1").fetchone()
+        if latest is None or row is None or row[0] is None:
+            return latest
+        return min(latest, row[0])
+
+    def lookup(self, stock_numbers):
+        """{stock number: entry} for those of stock_numbers in the map; entries hold id, name, price and updated_at."""
+        stock_numbers = list(stock_numbers)
+        found = {}
+        with closing(self._connect()) as db:
+            for start in range(0, len(stock_numbers), LOOKUP_CHUNK):
+                chunk = stock_numbers[start:start + LOOKUP_CHUNK]
+                rows = db.execute(
+                    "SELECT stock_number, item_id, name, price, updated_at FROM items"
+                    f" WHERE stock_number IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for stock_number, item_id, name, price, updated_at in rows:
+                    found[stock_number] = {"id": item_id, "name": name, "price": price, "updated_at": updated_at}
+        return found
+
+    def _rows(self, entries, synced_at):
+        for stock_number, entry in entries:
+            yield (
+                stock_number, entry["id"], entry["name"], entry.get("price"),
+                entry.get("updated_at"), updated_timestamp(entry.get("updated_at")), synced_at
+            )
+
+    def _record_sync_start(self, db, sync_started_at):
+        db.execute(
+            "INSERT INTO sync_state (id, sync_started_at) VALUES (1, ?)"
+            " ON CONFLICT (id) DO UPDATE SET sync_started_at = excluded.sync_started_at",
+            (sync_started_at,)
+        )
+
+    def replace_all(self, stock_map, full_synced_at, sync_started_at=None):
+        """
+        Replaces the whole map with stock_map ({stock number: entry}) in one
+        transaction, after a full rebuild that started reading the catalog
+        at sync_started_at (server time).
+        """
+        with closing(self._connect()) as db:
+            # an exception closes the connection before COMMIT, which rolls the transaction back
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM items")
+            db.executemany(
+                "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)", self._rows(stock_map.items(), time.time())
+            )
+            db.execute(
+                "INSERT INTO sync_state (id, full_synced_at) VALUES (1, ?)"
+                " ON CONFLICT (id) DO UPDATE SET full_synced_at = excluded.full_synced_at",
+                (full_synced_at,)
+            )
+            self._record_sync_start(db, sync_started_at)
+            db.execute("COMMIT")
+
+    def upsert(self, entries, sync_started_at=None):
+        """
+        Merges changed items, given as (stock number, entry) pairs, in one
+        transaction, after an incremental sync that started reading the
+        catalog at sync_started_at (server time). An item renamed to another
+        Stock # loses its old row.
+        """
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            for row in self._rows(entries, time.time()):
+                db.execute("DELETE FROM items WHERE item_id = ? AND stock_number != ?", (row[1], row[0]))
+                db.execute("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            self._record_sync_start(db, sync_started_at)
+            db.execute("COMMIT")
@@ -0,0 +1,165 @@
+import pandas as pd
+
+from excel_export import StyledExcelWriter
+from file_utils import spooled_output
+
+XLSX = "xlsx"
+CSV = "csv"
+PARQUET = "parquet"
+OUTPUT_FORMATS = (XLSX, CSV, PARQUET)
+
+MIME_TYPES = {
+    XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    CSV: "text/csv",
+    PARQUET: "application/vnd.apache.parquet",
+}
+
+# Parquet chunks are buffered up to this many rows so per-page writes do not
+# end up as thousands of tiny row groups.
+PARQUET_ROW_GROUP_SIZE = 50_000
+
+
+def to_quantity(values):
+    """Parses quantities as floats, accepting German decimal commas; unreadable cells become NaN."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+    text = values.astype(str).str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(text, errors="coerce").astype(float)
+
+
+def apply_column_types(df, numeric=(), categorical=()):
+    """Returns df with the numeric columns parsed as quantities and the categorical ones as category."""
+    df = df.copy()
+    for col in numeric:
+        df[col] = to_quantity(df[col])
+    for col in categorical:
+        df[col] = df[col].astype("category")
+    return df
+
+
+class CsvTableWriter:
+    """Appends chunks to a UTF-8 CSV as they arrive; the header is written once."""
+
+    def __init__(self, columns, output_path=None, numeric=(), categorical=()):
+        self.columns = list(columns)
+        self.output_path = output_path
+        self.numeric = list(numeric)
+        self.categorical = list(categorical)
+        self.stream = open(output_path, "wb") if output_path else spooled_output()
+        self._write_csv(pd.DataFrame(columns=self.columns), header=True)
+        self.closed = False
+
+    def _write_csv(self, df, header=False):
+        self.stream.write(df.to_csv(header=header, index=False, lineterminator="\n").encode("utf-8"))
+
+    def write(self, df):
+        if df is None or df.empty:
+            return
+        self._write_csv(apply_column_types(df[self.columns], self.numeric, self.categorical))
+
+    def add_sheet(self, name, df):
+        """CSV holds a single table; extra sheets are dropped."""
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self.output_path:
+                self.stream.close()
+        if self.output_path:
+            return self.output_path
+        self.stream.seek(0)
+        return self.stream
+
+
+class ParquetTableWriter:
+    """
+    Writes chunks to a Parquet file with a fixed schema: numeric columns as
+    float64, categorical ones dictionary-encoded and everything else as text.
+
+    pyarrow is only imported when Parquet output is requested.
+    """
+
+    def __init__(self, columns, output_path=None, numeric=(), categorical=(),
+                 row_group_size=PARQUET_ROW_GROUP_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self.columns = list(columns)
+        self.output_path = output_path
+        self.numeric = list(numeric)
+        self.categorical = list(categorical)
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([
+            (col, pa.float64() if col in self.numeric
+             else pa.dictionary(pa.int32(), pa.string()) if col in self.categorical
+             else pa.string())
+            for col in self.columns
+        ])
+        self.target = output_path if output_path else spooled_output()
+        self.writer = pq.ParquetWriter(self.target, self.schema)
+        self.pending = []
+        self.pending_rows = 0
+        self.closed = False
+
+    def write(self, df):
+        if df is None or df.empty:
+            return
+        self.pending.append(df[self.columns])
+        self.pending_rows += len(df)
+        if self.pending_rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        df = pd.concat(self.pending, ignore_index=True)
+        self.pending = []
+        self.pending_rows = 0
+        text_columns = [col for col in self.columns if col not in self.numeric and col not in self.categorical]
+        df[text_columns] = df[text_columns].astype(object).where(df[text_columns].notna(), None)
+        df = apply_column_types(df, self.numeric, self.categorical)
+        self.writer.write_table(self._pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def add_sheet(self, name, df):
+        """Parquet holds a single table; extra sheets are dropped."""
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._flush()
+            self.writer.close()
+        if self.output_path:
+            return self.output_path
+        self.target.seek(0)
+        return self.target
+
+
+def open_table_writer(output_format, columns, output_path=None, numeric=(), categorical=(), **excel_options):
+    """
+    Opens a writer that takes the extracted table chunk by chunk.
+
+    Every writer has write(df), taking a DataFrame with the given columns,
+    add_sheet(name, df) for a small side table (kept by Excel output only) and
+    close(), which returns output_path or, when no path was given, a file
+    object positioned at the start. That file object stays in memory while
+    small and is spooled to a temp file once it grows past
+    file_utils.SPOOL_BYTES.
+
+    Args:
+        output_format: one of OUTPUT_FORMATS
+        columns: column names, in output order
+        output_path: file to write to; None keeps the output in memory
+        numeric: columns stored as numbers in CSV/Parquet output
+        categorical: columns stored as categories in Parquet output
+        excel_options: passed on to StyledExcelWriter (max_col_width, wrap_text, ...)
+    """
+    if output_format == XLSX:
+        return StyledExcelWriter(columns, output_path, **excel_options)
+    if output_format == CSV:
+        return CsvTableWriter(columns, output_path, numeric, categorical)
+    if output_format == PARQUET:
+        return ParquetTableWriter(columns, output_path, numeric, categorical)
+    raise ValueError(f"Unknown output format {output_format!r}; expected one of {', '.join(OUTPUT_FORMATS)}")
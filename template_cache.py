@@ -0,0 +1,116 @@
+import json
+import os
+from collections import OrderedDict
+
+from file_utils import atomic_write_json
+
+TEMPLATE_CACHE_FILE = "sennebogen_templates.json"
+MAX_TEMPLATES = 500
+# Bump when the detectors change so stale column boundaries are not reused
+TEMPLATE_VERSION = 2
+
+
+class ColumnTemplateCache:
+    """
+    On-disk store of resolved column boundaries (explicit_vertical_lines),
+    keyed by detector option and header fingerprint.
+
+    Entries are kept in least-recently-used order and the oldest are evicted
+    once there are more than max_entries. Hit/miss counters are kept both for
+    the current run and across runs (persisted with the entries).
+    """
+
+    def __init__(self, path=TEMPLATE_CACHE_FILE, max_entries=MAX_TEMPLATES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.total_hits = 0
+        self.total_misses = 0
+        self.added = {}
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable template cache '{self.path}': {e}")
+            return
+        if data.get("version") != TEMPLATE_VERSION:
+            return
+        for key, lines in data.get("entries", []):
+            self.entries[key] = lines
+        self.total_hits = data.get("hits", 0)
+        self.total_misses = data.get("misses", 0)
+
+    @staticmethod
+    def key(fingerprint, option):
+        return f"{option}:{fingerprint}"
+
+    def get(self, fingerprint, option):
+        key = self.key(fingerprint, option)
+        lines = self.entries.get(key)
+        if lines is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return list(lines)
+
+    def put(self, fingerprint, option, lines):
+        key = self.key(fingerprint, option)
+        self.entries[key] = list(lines)
+        self.entries.move_to_end(key)
+        self.added[key] = list(lines)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def export_updates(self):
+        """What this instance learned, for a worker process to hand back to the parent."""
+        return {"added": self.added, "hits": self.hits, "misses": self.misses}
+
+    def take_updates(self):
+        """Like export_updates, but starts over afterwards, for workers that report after every page."""
+        updates = self.export_updates()
+        self.added = {}
+        self.hits = 0
+        self.misses = 0
+        return updates
+
+    def merge_updates(self, updates):
+        for key, lines in updates["added"].items():
+            self.entries[key] = lines
+            self.entries.move_to_end(key)
+            self.added[key] = lines
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.hits += updates["hits"]
+        self.misses += updates["misses"]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "total_hits": self.total_hits + self.hits,
+            "total_misses": self.total_misses + self.misses,
+        }
+
+    def save(self):
+        """Writes the cache atomically so a crash mid-write never leaves a truncated file."""
+        if not self.path:
+            return
+        stats = self.stats()
+        data = {
+            "version": TEMPLATE_VERSION,
+            "hits": stats["total_hits"],
+            "misses": stats["total_misses"],
+            "entries": list(self.entries.items()),
+        }
+        atomic_write_json(self.path, data)